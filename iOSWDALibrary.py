@@ -1,50 +1,147 @@
 # -*- coding: utf-8 -*-
 import time
+import random
+import base64
+import collections
+import contextlib
+import functools
+import gzip
+import hashlib
+import html
+import io
+import queue
+import re
+import json
+import struct
+import math
+import operator
+import threading
+import requests
 import wda
 import sys
 import os.path
-from RPA.recognition import templates
-from wda.exceptions import WDAElementNotFoundError
+import tempfile
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from wda.exceptions import WDAElementNotFoundError, WDAStaleElementReferenceError
 from robot.api import logger
 from robot.api.deco import keyword
-from robot.libraries.BuiltIn import BuiltIn
-sys.setrecursionlimit(2000)
+from robot.libraries.BuiltIn import BuiltIn, RobotNotRunningError
+from robot.utils import is_truthy, secs_to_timestr, timestr_to_secs
 
 
 class iOSWDALibrary(object):
-    """Robot framework library for iOS UI test automation."""
+    """Robot framework library for iOS UI test automation.
+
+    Locators are written as ``prefix=criteria``:
+    | id=Buy / name=Buy           | accessibility identifier or name     |
+    | label=Buy / text=Buy        | exact label                          |
+    | labelContains=Bu            | label containing the text            |
+    | value=42                    | exact value                          |
+    | type=Button                 | element type, without ``XCUIElementType`` |
+    | predicate=label BEGINSWITH 'B' | iOS predicate string               |
+    | classchain=**/XCUIElementTypeCell[`name == 'row'`] | iOS class chain |
+    | xpath=//XCUIElementTypeButton | xpath, slow on big pages            |
+
+    Locators can be chained with `` >> ``, every step being searched inside the
+    previous one, and ``index=N`` picks the N-th (0 based) match of the step
+    before it, e.g. ``type=Table >> type=Cell >> index=2 >> labelContains=Buy``.
+    Chains run as one class chain query; they support every prefix but
+    ``xpath``. `` >> `` inside quotes, or not followed by a prefix, is part of
+    the locator, e.g. ``predicate=label == "a >> b"``.
+    """
     ROBOT_LISTENER_API_VERSION = 3
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
 
     def __init__(self):
-        self.ROBOT_LIBRARY_LISTENER = self
+        self._profiler = _Profiler()
+        self.ROBOT_LIBRARY_LISTENER = [self, self._profiler]
         self.client = None
         self.session = None
         self.bundle_id = None
+        self._snapshot = None
+        self._snapshot_enabled = False
+        self._snapshot_ttl = 5.0
+        self._local_xpath = False
+        self._verify_xpath = False
+        self._hybrid_ttl = None
+        self._web_view = (None, 0)
+        self._poll_initial = 0.05
+        self._poll_max = 0.5
+        self._transport = {
+            'pool_size': 4,
+            'connect_timeout': 10.0,
+            'read_timeout': 180.0,
+            'retries': 2,
+            'failure_threshold': 3,
+            'reset_timeout': 30.0,
+            'watchdog': None
+        }
+        self._circuit = None
+        self._transport_stats = _TransportStats()
+        self._transport_stats.on_record = self._profiler.record_request
+        self._device_pool = None
+        self._leased_device = None
+        self._screenshots = _ScreenshotWriter()
+        self._gestures = None
+        self._device_geometry = None
+        self._screen_recorder = None
+        self._screen_changed = 0
+        self._wda_url = None
+        self._sessions = _SessionRegistry(os.path.join(tempfile.gettempdir(), 'iOSWDALibrary-sessions.json'))
+        self._startup_times = []
+        self._recorder = None
+        self._replay_server = None
         self._strategies = {
             'id': self._find_by_id,
             'name': self._find_by_name,
             'xpath': self._find_by_xpath,
             'label': self._find_by_label,
             'value': self._find_by_value,
-            'text': self._find_by_label
+            'text': self._find_by_label,
+            'predicate': self._find_by_predicate,
+            'classchain': self._find_by_class_chain,
+            'type': self._find_by_type,
+            'labelcontains': self._find_by_label_contains,
+            'chain': self._find_by_chain
         }
+        self._profiler.locator_prefixes = frozenset(self._strategies)
 
-    def open_application(self, wda_url='http://127.0.0.1:8100', bundle_id='com.daimler.ris.mercedesme.cn.ios.stage'):
+    def open_application(self, wda_url='http://127.0.0.1:8100', bundle_id='com.daimler.ris.mercedesme.cn.ios.stage',
+                         reuse_session=False):
         """Opens a new application to given wda server.
 
+        With `reuse_session` the WDA session last opened for the same `wda_url`
+        and `bundle_id`, by this or another process (e.g. pabot workers), is
+        reused if WDA reports it as still running; the application is then only
+        brought to the foreground instead of being relaunched in a new session.
+        Sessions are kept in ``iOSWDALibrary-sessions.json`` in the temporary
+        directory. The startup time is logged, see `Get Application Startup Times`.
+
         Examples:
         | Open Application | wda_url=http://internalserver:port | bundle_id=com.daimler.ris.mercedesme.cn.ios.stage
+        | Open Application | wda_url=http://internalserver:port | bundle_id=com.apple.Preferences | reuse_session=True |
         """
-        self.client = wda.Client(wda_url)
-        self.client.wait_ready(timeout=10, noprint=False)
-        self.bundle_id = bundle_id
-        self.session = self.client.session(bundle_id)
+        self._connect(wda_url, bundle_id, is_truthy(reuse_session))
 
     def close_application(self):
         """Closes the current application and also close wda session."""
+        self.stop_screen_recording()
+        self._sessions.remove(self._wda_url, self.bundle_id)
         self.session.close()
 
+    def get_application_startup_times(self):
+        """Returns the startup of every application opened, as a list of dictionaries.
+
+        Each has the ``wda_url``, ``bundle_id``, startup ``seconds`` and whether
+        the session was ``reused``. They are also written to the output
+        directory at the end of each suite, in ``wda-startup-times-<suite id>.json``,
+        e.g. ``wda-startup-times-s1-s2.json``.
+        """
+        return [dict(startup) for startup in self._startup_times]
+
     def launch_application(self):
         """ Launch application. Application can be launched while wda session running.
         This keyword can be used to launch application during test case or between test cases.
@@ -66,7 +163,8 @@ class iOSWDALibrary(object):
 
         See `Quit Application` for quiting application but keeping wda sesion running.
         """
-        self.session.app_activate(self.bundle_id)
+        with self._changing_screen():
+            self.session.app_activate(self.bundle_id)
 
     def quit_application(self):
         """ Quit application. Application can be quit while wda session is kept alive.
@@ -74,13 +172,15 @@ class iOSWDALibrary(object):
 
         See `Launch Application` for an explanation.
         """
-        self.session.app_terminate(self.bundle_id)
+        with self._changing_screen():
+            self.session.app_terminate(self.bundle_id)
     
     def swtich_application(self, bundle_id):
-        self.session.app_terminate(bundle_id)
+        with self._changing_screen():
+            self.session.app_terminate(bundle_id)
         
     def capture_page_screenshot(self, filepath):
-        self.session.screenshot().save(filepath)
+        return self._screenshots.save(self._screenshot(), filepath)[0]
 
     @keyword(tags=['expand', ])
     def capture_screenshot(self, filepath):
@@ -96,19 +196,87 @@ class iOSWDALibrary(object):
         `css` can be used to modify how the screenshot is taken. By default
         the background color is changed to avoid possible problems with
         background leaking when the page layout is somehow broken.
+
+        See `Set Screenshot Options` for the image format, log thumbnails and
+        background writing. While `Start Screen Recording` runs, the latest
+        recorded frame is used when it shows the screen after the last action.
+        Returns the path of the saved image.
         """
-        logfile = BuiltIn().get_variable_value('${LOG FILE}')
-        logdir = os.path.split(logfile)[0]
-        filedir = os.path.split(os.path.abspath(filepath))[0]
-        filename = os.path.split(filepath)[1]
-        logger.info('screenshot is saved in: %s' % filedir)
-        relative_path = os.path.relpath(filedir, logdir)
+        filepath, thumbnail = self._screenshots.save(self._screenshot(), filepath)
+        logger.info('screenshot is saved in: %s' % os.path.split(os.path.abspath(filepath))[0])
+
+        image = self._log_link(filepath)
+        if thumbnail:
+            thumbnail = self._log_link(thumbnail)
+            logger.info('<div><a href="%s"><img src="%s"/></a></div>' % (image, thumbnail), True)
+        else:
+            logger.info('<div><img src="%s" Width="288" height="512"/></div>' % image, True)
+        return filepath
 
-        self.session.screenshot().save(filepath)
-        logger.info('<div><img src="%s\%s" Width="288" height="512"/></div>' % (relative_path, filename), True)
+    def set_screenshot_options(self, format='png', quality=80, thumbnail_width=0, background=False, dedupe=False):
+        """Configures how `Capture Screenshot` and `Capture Page Screenshot` store images.
+
+        Args:
+         - format - ``png`` writes the bytes sent by WDA as they are, ``jpeg`` or ``webp``
+           re-encode them with ``quality`` and replace the file extension
+         - thumbnail_width - if set, a JPEG thumbnail of that width is written next to
+           the image and embedded in the log instead of the full image
+         - background - encode and write images on a background thread, all pending
+           images are written at the end of each suite
+         - dedupe - do not write a screenshot identical to the previous one, the
+           previous file is used instead
+
+        Example:
+        | Set Screenshot Options | format=jpeg | quality=70 | thumbnail_width=200 | background=True |
+        """
+        if format.lower() not in ('png', 'jpeg', 'webp'):
+            raise ValueError("Screenshot format should be png, jpeg or webp, not '%s'" % format)
+        self._screenshots.flush()
+        self._screenshots.configure(format.lower(), int(quality), int(thumbnail_width),
+                                    is_truthy(background), is_truthy(dedupe))
+
+    def start_screen_recording(self, fps=2, buffer='10s', mjpeg_url=None):
+        """Records the screen of the opened application in the background.
+
+        Frames are taken `fps` times per second and the last `buffer` of them
+        are kept in memory. With `mjpeg_url`, e.g. ``http://127.0.0.1:9100``, the
+        frames are read from the WDA MJPEG server; otherwise screenshots are
+        polled on a background thread.
+
+        When a test fails, the recorded frames are saved as
+        ``wda-recording-<test id>.gif`` in the output directory and linked from
+        the test message. `Capture Screenshot` uses the recorded frames too.
+        The recording stops with `Stop Screen Recording` or `Close Application`.
+
+        Example:
+        | Open Application | http://127.0.0.1:8100 | com.apple.Preferences |
+        | Start Screen Recording | fps=4 | buffer=20s | mjpeg_url=http://127.0.0.1:9100 |
+        """
+        self.stop_screen_recording()
+        self._screen_recorder = _ScreenRecorder(self._wda_url, float(fps), timestr_to_secs(buffer),
+                                                mjpeg_url).start()
+
+    def stop_screen_recording(self):
+        """Stops the recording started by `Start Screen Recording`, if any."""
+        if self._screen_recorder is not None:
+            self._screen_recorder.stop()
+            self._screen_recorder = None
+
+    def save_screen_recording(self, path, seconds=None):
+        """Saves the frames recorded by `Start Screen Recording` as an animated GIF to `path`.
+
+        Only the last `seconds` are saved if given. The GIF is embedded into the log.
+        """
+        if self._screen_recorder is None:
+            raise AssertionError("Screen recording is not started")
+        if not self._screen_recorder.save_gif(path, timestr_to_secs(seconds) if seconds else None):
+            raise AssertionError("No frame has been recorded: %s" % self._screen_recorder.error)
+        logger.info('<img src="%s" width="288"/>' % self._log_link(path), True)
+        return path
 
     def press_home_button(self):
-        self.client.home()
+        with self._changing_screen():
+            self.client.home()
 
     def get_text(self, locator):
         """Get element text (for hybrid and mobile browser use `xpath` locator, others might cause problem)
@@ -126,23 +294,36 @@ class iOSWDALibrary(object):
 
         See `introduction` for details about locating elements.
         """
-        element = self._find_element(locator).get(timeout=0)
-        element.clear_text()
+        with self._changing_screen():
+            element = self._element_handle(locator).get()
+            element.clear_text()
 
     def input_text(self, locator, text):
         """Types the given `text` into text field identified by `locator`.
 
         See `introduction` for details about locating elements.
         """
-        element = self._find_element(locator).get(timeout=0)
-        element.set_text(text)
+        with self._changing_screen():
+            element = self._element_handle(locator).get()
+            element.set_text(text)
     
     def click_a_point(self, x, y, duration=100):
-        """ Click on a point"""
+        """ Click on a point
+
+        `x` and `y` are in points, in percent of the window (``50%``) or in
+        screenshot pixels (``240px``), see `Get Device Geometry`.
+
+        Example:
+        | Click A Point | 50% | 90% |
+        | ${point} = | Find Image On Screen | ${CURDIR}/icons/bell.png |
+        | Click A Point | ${point}[x]px | ${point}[y]px |
+        """
         __duration = int(duration)/1000
-        if duration:
-            return self.client.click(int(float(x)), int(float(y)), __duration)
-        return self.client.click(x, y)
+        x, y = self._point(x, y)
+        with self._changing_screen():
+            if duration:
+                return self.client.click(int(x), int(y), __duration)
+            return self.client.click(int(x), int(y))
 
     def click_element(self, locator):
         """Click element identified by `locator`.
@@ -150,8 +331,12 @@ class iOSWDALibrary(object):
         Key attributes for arbitrary elements are `index` and `name`. See
         `introduction` for details about locating elements.
         """
-        if self._find_element(locator).exists:
-            self._find_element(locator).click()
+        (prefix, _) = self._parse_locator(locator)
+        # the page source is only worth fetching to evaluate an xpath locally
+        element = self._element_handle(locator, local=self._local_xpath and prefix == 'xpath')
+        if element.exists:
+            with self._changing_screen():
+                element.click()
         else:
             logger.info(f"Locator:{locator} not disppear!", also_console=True)
             raise WDAElementNotFoundError(f"Locator:{locator} not disppear!")
@@ -165,12 +350,13 @@ class iOSWDALibrary(object):
         If there are multiple use  of ``text`` and you do not want first one,
         use `locator` with `Get Web Elements` instead.
         """
-        if exact_match:
-            _xpath = u'//*[@value="{}" or @label="{}"]'.format(text, text)
-        else:
-            _xpath = u'//*[contains(@label,"{}") or contains(@value, "{}")]'.format(text, text)
-        if self._find_by_xpath(_xpath).exists:
-            self._find_by_xpath(_xpath).click()
+        _predicate = _text_predicate(text, exact_match)
+        element = self._find_in_web_view(_predicate)
+        if element is None or not element.exists:
+            element = _ElementHandle(self._find_by_predicate(_predicate), 'predicate=' + _predicate)
+        if element.exists:
+            with self._changing_screen():
+                element.click()
         else:
             logger.info(f"Text:{text} not disppear!", also_console=True)
             raise WDAElementNotFoundError(f"Text:{text} not disppear!")
@@ -185,12 +371,19 @@ class iOSWDALibrary(object):
          - offset_x - x-coordinate distance from start_x at which to stop
          - offset_y - y-coordinate distance from start_y at which to stop
          - duration - (optional) time to take the swipe, in ms.
+
+        Coordinates can also be given in percent of the window or in screenshot
+        pixels, like with `Click A Point`.
         
         Usage:
         | Swipe | 500 | 100 | 100 | 0 | 1000 |
+        | Swipe | 50% | 80% | 50% | 20% |
         """
         _duration = int(duration)/1000
-        self.client.swipe(int(float(start_x)), int(float(start_y)), int(float(offset_x)), int(float(offset_y)), _duration)
+        start_x, start_y = self._point(start_x, start_y)
+        offset_x, offset_y = self._point(offset_x, offset_y)
+        with self._changing_screen():
+            self.client.swipe(int(start_x), int(start_y), int(offset_x), int(offset_y), _duration)
 
     def element_attribute_should_match(self, locator, attr_name, match_pattern):
         """Verify that an attribute of an element matches the expected criteria.
@@ -213,7 +406,7 @@ class iOSWDALibrary(object):
         | 1. is a string pattern match i.e. the 'text' attribute should end with the string 'foobar'
         | 2. is a boolead match i.e. the 'enabled' attribute should be True
         """
-        elements = self._find_element(locator).get(timeout=0)
+        elements = self._get_element(locator)
         # if len(elements) > 1:
         #     raise IndexError("CAUTION: '%s' matched %s elements - using the first element only" % (locator, len(elements)))
         if attr_name == "value":
@@ -237,7 +430,7 @@ class iOSWDALibrary(object):
         Key attributes for arbitrary elements are `id` and `name`. See
         `introduction` for details about locating elements.
         """
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         if element.visible:
             logger.info("Element '%s' is visible " % locator)
             return
@@ -284,7 +477,7 @@ class iOSWDALibrary(object):
 
         ``message`` can be used to override the default error message.
         """
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         actual = element.label
         if expected != actual:
             if not message:
@@ -294,7 +487,7 @@ class iOSWDALibrary(object):
         logger.info("Element '%s' text is '%s' " % (locator, expected))
 
     def element_value_should_be(self, locator, expected):
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         if str(expected) != str(element.value):
             raise AssertionError("Element '%s' value should be '%s' "
                                  "but it is '%s'." % (locator, expected, element.value))
@@ -308,7 +501,7 @@ class iOSWDALibrary(object):
         | Get Element Attribute | locator | name |
         | Get Element Attribute | locator | value |
         """
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         if element is not None:
             if attribute == "value":
                 logger.info("Element '%s' value: %s" %(locator,element.value))
@@ -328,7 +521,7 @@ class iOSWDALibrary(object):
         `introduction` for details about locating elements.
         """
         location={'x':'','y':'','width':'','height':''}
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         element_bounds = element.bounds
         location['x'] = element_bounds.x
         location['y'] = element_bounds.y
@@ -337,25 +530,123 @@ class iOSWDALibrary(object):
         logger.info("Element '%s' location: %s " % (locator, element_bounds))
         return location
 
+    def get_elements_data(self, locator):
+        """Returns the data of all elements matching `locator`, e.g. the rows of a list.
+
+        Every element is returned as a dictionary with the keys ``label``,
+        ``value``, ``name``, ``type``, ``rect`` (as returned by
+        `Get Element Location`), ``visible`` and ``enabled``. Locators that can be
+        evaluated on the page source (see `Enable Page Snapshot`, and
+        `Enable Local XPath` for ``xpath=``) need one request for all elements;
+        other locators are resolved once by WDA and cost one request per element
+        property.
+
+        Example:
+        | ${rows} = | Get Elements Data | type=Cell |
+        | Should Be Equal | ${rows}[0][label] | General |
+        | Should Be True | ${rows}[0][enabled] |
+        """
+        data = self._elements_data(locator)
+        logger.info("Locator '%s' matched %d elements: %s" % (locator, len(data), data))
+        return data
+
+    def element_count_should_be(self, locator, expected):
+        """Verifies that `locator` matches exactly `expected` elements."""
+        count = len(self._elements_data(locator))
+        if count != int(expected):
+            raise AssertionError("Locator '%s' should have matched %s elements but it matched %d."
+                                 % (locator, expected, count))
+        logger.info("Locator '%s' matched %d elements." % (locator, count))
+
+    def elements_texts_should_be(self, locator, *expected):
+        """Verifies that the texts of the elements matching `locator` are `expected`, in order.
+
+        The text of an element is its label, or its value when it has no label,
+        like with `Get Text`. All rows are checked at once and every mismatch is
+        reported.
+
+        Example:
+        | Elements Texts Should Be | type=Cell >> type=StaticText | General | Privacy | About |
+        """
+        actual = [row['value'] if row['label'] is None else row['label']
+                  for row in self._elements_data(locator)]
+        errors = ["element %d text should have been '%s' but it was '%s'" % (index, text, found)
+                  for index, (text, found) in enumerate(zip(expected, actual)) if text != found]
+        if len(actual) != len(expected):
+            errors.insert(0, "%d elements should have matched but %d did" % (len(expected), len(actual)))
+        if errors:
+            raise AssertionError("Locator '%s': %s." % (locator, '; '.join(errors)))
+        logger.info("Locator '%s' texts are %s." % (locator, actual))
+
+    def every_element_attribute_should_be(self, locator, attr_name, expected):
+        """Verifies that the attribute `attr_name` of every element matching `locator` is `expected`.
+
+        `attr_name` is one of the keys returned by `Get Elements Data` but
+        ``rect``. Booleans match ``True``/``true`` and ``False``/``false``.
+        Fails if no element matches.
+
+        Example:
+        | Every Element Attribute Should Be | type=Cell | enabled | True |
+        | Every Element Attribute Should Be | type=Switch | value | 1 |
+        """
+        data = self._elements_data(locator)
+        if not data:
+            raise AssertionError("Locator '%s' did not match any element." % locator)
+        if attr_name not in data[0] or attr_name == 'rect':
+            raise ValueError("Attribute '%s' is not one of %s"
+                             % (attr_name, ', '.join(sorted(key for key in data[0] if key != 'rect'))))
+        errors = ["element %d %s was '%s'" % (index, attr_name, row[attr_name])
+                  for index, row in enumerate(data) if str(row[attr_name]).lower() != str(expected).lower()]
+        if errors:
+            raise AssertionError("Locator '%s' %s should have been '%s' but %s."
+                                 % (locator, attr_name, expected, '; '.join(errors)))
+        logger.info("All %d elements '%s' have %s '%s'." % (len(data), locator, attr_name, expected))
+
     def get_window_height(self):
         """Get current device height.
 
+        The size is read once per session, see `Get Device Geometry`.
+
         Example:
         | ${width}       | Get Window Width |
         | ${height}      | Get Window Height |
         | Click A Point  | ${width}         | ${height} |
         """
-        return self.client.window_size().height
+        return self._geometry().height
 
     def get_window_width(self):
         """Get current device width.
 
+        The size is read once per session, see `Get Device Geometry`.
+
         Example:
         | ${width}       | Get Window Width |
         | ${height}      | Get Window Height |
         | Click A Point  | ${width}          | ${height} |
         """
-        return self.client.window_size().width
+        return self._geometry().width
+
+    def get_device_geometry(self):
+        """Returns the window ``width`` and ``height`` in points, the ``scale`` factor,
+        the screenshot ``pixel_width`` and ``pixel_height`` and the ``orientation``.
+
+        The geometry is read once per session and cached. It is read again when a
+        page source or screenshot shows that the device was rotated, or after
+        `Set Device Orientation`. Coordinate keywords use it to convert
+        coordinates given in percent of the window (``25%``) or in screenshot
+        pixels (``240px``, e.g. from `Find Image`) without extra requests.
+        """
+        return self._geometry().as_dict()
+
+    def set_device_orientation(self, orientation):
+        """Rotates the device to `orientation`, ``PORTRAIT`` or ``LANDSCAPE``.
+
+        Example:
+        | Set Device Orientation | LANDSCAPE |
+        """
+        self._device_geometry = None
+        with self._changing_screen():
+            self.session.orientation = orientation.upper()
 
     def page_should_contain_text(self, text):
         """Verifies that current page contains `text`., if you would not
@@ -378,6 +669,21 @@ class iOSWDALibrary(object):
         else:
             raise AssertionError("Page should not have contained text '%s'" % text)
 
+    def page_should_contain_all_texts(self, *texts):
+        """Verifies that current page contains every one of `texts`.
+
+        All texts are searched in one page source and every missing text is
+        reported.
+
+        Example:
+        | Page Should Contain All Texts | General | Privacy | About |
+        """
+        snapshot = self._page_snapshot()
+        missing = [text for text in texts if not snapshot.contains_text(text)]
+        if missing:
+            raise AssertionError("Page should have contained texts %s but did not" % _quote_items(missing))
+        logger.info("Current page contains texts %s." % _quote_items(texts))
+
     def page_should_contain_element(self, locator):
         """Verifies that current page contains `locator` element.
 
@@ -396,93 +702,262 @@ class iOSWDALibrary(object):
         else:
             raise AssertionError("Page should not have contained element '%s'" % locator)
 
-    def wait_until_page_contains(self, text, timeout='10s'):
+    def enable_page_snapshot(self, ttl='5s'):
+        """Answers read-only keywords from one cached copy of the page source.
+
+        The page source is fetched once and reused by `Page Should Contain Text`,
+        `Page Should Contain Element`, `Get Text` and the element attribute keywords
+        until `ttl` expires or a keyword that changes the screen (`Click Element`,
+        `Click Text`, `Swipe`, `Input Text`, `Drag And Drop By Element`...) is run.
+        Locators that can not be evaluated on the page source are still sent to WDA.
+
+        Example:
+        | Enable Page Snapshot | ttl=3s |
+        | Page Should Contain Text | foo |
+        | Page Should Contain Text | bar |
+        """
+        self._snapshot_ttl = timestr_to_secs(ttl)
+        self._snapshot_enabled = True
+        self._invalidate_snapshot()
+
+    def disable_page_snapshot(self):
+        """Sends every element query to WDA again. See `Enable Page Snapshot`."""
+        self._snapshot_enabled = False
+        self._invalidate_snapshot()
+
+    def enable_local_xpath(self, verify=False):
+        """Evaluates ``xpath=`` locators on the page source instead of on the device.
+
+        WDA serializes the whole element tree for every xpath query. With local
+        evaluation the page source is fetched once (or taken from the page
+        snapshot, see `Enable Page Snapshot`), the xpath runs in process and
+        `Click Element` taps the center of the element found. `Get Elements Data`,
+        `Scroll Until Element Visible`, queued gestures and the waits watching the
+        page also evaluate xpaths on their page source only when it is enabled.
+        Any XPath 1.0 expression is supported when ``lxml`` is installed,
+        otherwise only the subset of ``xml.etree.ElementTree`` and other xpaths
+        are sent to WDA.
+
+        With `verify` every local result is compared with the result of WDA and a
+        warning is logged when they differ. It costs the device query again, use
+        it to validate the locators of a suite.
+
+        Example:
+        | Enable Local XPath | verify=True |
+        | Click Element | xpath=//XCUIElementTypeCell[.//XCUIElementTypeStaticText[@label="Buy"]] |
+        """
+        self._local_xpath = True
+        self._verify_xpath = is_truthy(verify)
+
+    def disable_local_xpath(self):
+        """Sends ``xpath=`` locators to WDA again. See `Enable Local XPath`."""
+        self._local_xpath = False
+        self._verify_xpath = False
+
+    def enable_hybrid_mode(self, detect_ttl='2s'):
+        """Searches texts and elements inside the web views of the screen first.
+
+        The content of a ``WKWebView`` makes the element tree deep and slow to
+        query as a whole. In hybrid mode `Click Text`, `Page Should Contain Text`,
+        `Page Should Contain Element`, `Wait Until Page Contains` and
+        `Wait Until Page Contains Element` first run a class chain query limited
+        to the web views, like the locator ``type=WebView >> labelContains=Buy``.
+        What is not found there, and screens without web view, take the usual
+        path. Whether the screen has a web view is checked with a light query
+        and remembered for `detect_ttl`.
+
+        Locators other than ``xpath=`` and chains are searched in the web views;
+        elements found in the page snapshot (see `Enable Page Snapshot`) are not
+        searched again.
+
+        Example:
+        | Enable Hybrid Mode |
+        | Wait Until Page Contains | Terms and conditions |
+        """
+        self._hybrid_ttl = timestr_to_secs(detect_ttl)
+        self._web_view = (None, 0)
+
+    def disable_hybrid_mode(self):
+        """Searches the whole element tree again. See `Enable Hybrid Mode`."""
+        self._hybrid_ttl = None
+
+    def get_source(self):
+        """Returns the page source of the current application as XML."""
+        return self.session.source()
+
+    def wait_until_page_contains(self, text, timeout='10s', stable_time=None):
         """Waits until `text` appears on current page.
 
         Fails if `timeout` expires before the text appears. See
         `introduction` for more information about `timeout` and its
         default value.
 
+        `stable_time` (for example ``500ms``) additionally requires the condition
+        to hold for that long before the keyword passes.
+
         See also `Wait Until Page Does Not Contain`,
         `Wait Until Page Contains Element`,
         `Wait Until Page Does Not Contain Element` and
         BuiltIn keyword `Wait Until Keyword Succeeds`.
         """
-        __timeout = int(timeout.lower().replace('s', ''))
-        maxtime = time.time() + __timeout
-        while True:
-            if self.__is_text_present(str(text)):
-                return
-            if time.time() > maxtime:
-                raise AssertionError("Text '%s' did not appear in %ss" % (text, __timeout))
-            time.sleep(0.2)
+        self._wait_until(lambda: self.__is_text_present(str(text)), timeout,
+                         "Text '%s' did not appear" % text, stable_time)
 
-    def wait_until_page_contains_element(self, locator, timeout='10s'):
+    def wait_until_page_contains_element(self, locator, timeout='10s', stable_time=None):
         """Waits until element specified with `locator` appears on current page.
 
         Fails if `timeout` expires before the element appears. See
         `introduction` for more information about `timeout` and its
         default value.
 
+        `stable_time` (for example ``500ms``) additionally requires the condition
+        to hold for that long before the keyword passes.
+
         See also `Wait Until Page Contains`,
         `Wait Until Page Does Not Contain`
         `Wait Until Page Does Not Contain Element`
         and BuiltIn keyword `Wait Until Keyword Succeeds`.
         """
-        __timeout = int(timeout.lower().replace('s', ''))
-        maxtime = time.time() + __timeout
-        while True:
-            if self.__is_element_present(locator):
-                return
-            if time.time() > maxtime:
-                raise AssertionError("Element '%s' did not appear in %ss" % (locator, __timeout))
-            time.sleep(0.2)
+        self._wait_until(lambda: self.__is_element_present(locator), timeout,
+                         "Element '%s' did not appear" % locator, stable_time)
 
-    def wait_until_page_does_not_contain_element(self, locator, timeout='10s'):
+    def wait_until_page_does_not_contain_element(self, locator, timeout='10s', stable_time=None):
         """Waits until element specified with `locator` disappears from current page.
 
         Fails if `timeout` expires before the element disappears. See
         `introduction` for more information about `timeout` and its
         default value.
 
-        `error` can be used to override the default error message.
+        `stable_time` (for example ``500ms``) additionally requires the condition
+        to hold for that long before the keyword passes.
+
+        The page source is fetched on every poll and the element is only
+        searched again when the page changed.
 
         See also `Wait Until Page Contains`,
         `Wait Until Page Does Not Contain`,
         `Wait Until Page Contains Element` and
         BuiltIn keyword `Wait Until Keyword Succeeds`.
         """
-        __timeout = int(timeout.lower().replace('s', ''))
-        maxtime = time.time() + __timeout
-        while True:
-            if self.__is_element_present(locator) is False:
-                return
-            if time.time() > maxtime:
-                raise AssertionError("Element '%s' still in %ss" % (locator, __timeout))
-            time.sleep(0.2)
+        watcher = _PageWatcher(self.session.source)
+        self._wait_until(watcher.watch(lambda snapshot: self.__is_element_present(locator, snapshot) is False),
+                         timeout, "Element '%s' still" % locator, stable_time)
 
-    def wait_until_page_does_not_contain(self, text, timeout='10s'):
-        """Waits until element specified with `locator` disappears from current page.
+    def wait_until_page_does_not_contain(self, text, timeout='10s', stable_time=None):
+        """Waits until `text` disappears from current page.
 
-        Fails if `timeout` expires before the element disappears. See
+        Fails if `timeout` expires before the text disappears. See
         `introduction` for more information about `timeout` and its
         default value.
 
-        `error` can be used to override the default error message.
+        `stable_time` (for example ``500ms``) additionally requires the condition
+        to hold for that long before the keyword passes.
+
+        The page source is fetched on every poll and only searched again when
+        the page changed.
 
         See also `Wait Until Page Contains`,
-        `Wait Until Page Does Not Contain`,
-        `Wait Until Page Contains Element` and
+        `Wait Until Page Contains Element`,
+        `Wait Until Page Does Not Contain Element` and
         BuiltIn keyword `Wait Until Keyword Succeeds`.
         """
-        __timeout = int(timeout.lower().replace('s', ''))
-        maxtime = time.time() + __timeout
-        while True:
-            if self.__is_text_present(text) is False:
-                return
-            if time.time() > maxtime:
-                raise AssertionError("text '%s' still in %ss" % (text, __timeout))
-            time.sleep(0.2)
+        watcher = _PageWatcher(self.session.source)
+        self._wait_until(watcher.watch(lambda snapshot: snapshot.contains_text(text) is False), timeout,
+                         "text '%s' still" % text, stable_time)
+
+    def wait_until_page_is_stable(self, stable_time='500ms', timeout='10s'):
+        """Waits until the page source did not change for `stable_time`, e.g. after an animation.
+
+        Use it instead of fixed sleeps after actions that change the screen.
+        Fails if the page still changes after `timeout`.
+
+        Example:
+        | Click Element | name=Settings |
+        | Wait Until Page Is Stable |
+        | Wait Until Page Is Stable | stable_time=1s | timeout=20s |
+        """
+        watcher = _PageWatcher(self.session.source)
+        self._wait_until(lambda: watcher.poll() is False, timeout,
+                         "Page did not stay unchanged for %s" % stable_time, stable_time)
+        logger.info("Page changed %d times before becoming stable." % (watcher.changes - 1))
+
+    def wait_until_page_contains_any(self, *items, timeout='10s'):
+        """Waits until one of `items` appears on current page and returns the first one found.
+
+        Items with a locator prefix, e.g. ``name=Buy``, are elements; other
+        items are texts. Every poll fetches the page source once and checks all
+        items against it, again only when the page changed.
+
+        Example:
+        | ${found} = | Wait Until Page Contains Any | Welcome | name=Login | timeout=20s |
+        | Run Keyword If | '${found}' == 'name=Login' | Log In |
+        """
+        found = []
+        watcher = _PageWatcher(self.session.source)
+
+        def check(snapshot):
+            found[:] = [item for item in items if self.__is_item_present(item, snapshot)]
+            return bool(found)
+        self._wait_until(watcher.watch(check), timeout,
+                         "None of %s appeared" % _quote_items(items))
+        logger.info("Current page contains %s." % _quote_items(found))
+        return found[0]
+
+    def wait_until_page_contains_all(self, *items, timeout='10s'):
+        """Waits until every one of `items` appears on current page.
+
+        Items are texts or element locators like with `Wait Until Page Contains Any`.
+        On timeout the items that did not appear are reported.
+
+        Example:
+        | Wait Until Page Contains All | General | Privacy | type=Switch |
+        """
+        missing = list(items)
+        watcher = _PageWatcher(self.session.source)
+
+        def check(snapshot):
+            missing[:] = [item for item in items if not self.__is_item_present(item, snapshot)]
+            return not missing
+        self._wait_until(watcher.watch(check), timeout,
+                         lambda: "%s did not appear" % _quote_items(missing))
+        logger.info("Current page contains %s." % _quote_items(items))
+
+    def scroll_until_element_visible(self, locator, container=None, direction='down', max_swipes=10, duration='300ms'):
+        """Swipes `container` until the element identified by `locator` is visible and returns it.
+
+        Every swipe moves the content by 60% of the `container` element, the
+        whole screen by default, towards `direction` (``down``, ``up``, ``left``
+        or ``right``) in `duration`. The page source is read once per swipe to
+        check the element and to stop as soon as the content no longer moves.
+        Fails when the end of the content is reached or after `max_swipes`.
+
+        Example:
+        | ${row} = | Scroll Until Element Visible | name=row42 | container=type=Table |
+        """
+        (prefix, criteria) = self._parse_locator(locator)
+
+        def find(snapshot):
+            if self._evaluates_on_source(prefix, criteria):
+                nodes = [node for node in snapshot.find(prefix, criteria) if node.get('visible') == 'true']
+                return _SnapshotElement(nodes[0], self.session, locator) if nodes else None
+            if self.__is_element_present(locator):
+                return self._element_handle(locator).get()
+            return None
+        return self._scroll_until(find, "Element '%s'" % locator, container, direction, max_swipes, duration)
+
+    def scroll_until_text_visible(self, text, container=None, direction='down', max_swipes=10, duration='300ms'):
+        """Swipes `container` until `text` is visible and returns the element containing it.
+
+        See `Scroll Until Element Visible` for the arguments.
+
+        Example:
+        | Scroll Until Text Visible | Privacy | direction=down | max_swipes=5 |
+        """
+        def find(snapshot):
+            for node in snapshot.text_nodes(text):
+                return _SnapshotElement(node, self.session, text)
+            return None
+        return self._scroll_until(find, "Text '%s'" % text, container, direction, max_swipes, duration)
 
     def hide_keyboard(self,key_name=None):
         """Hides the software keyboard on the device. (optional) In iOS, use `key_name` to press
@@ -496,8 +971,9 @@ class iOSWDALibrary(object):
         Args:
         - _locator_
         """
-        element = self._find_element(locator)
-        element.pinch(0.5, -1)
+        with self._changing_screen():
+            element = self._find_element(locator)
+            element.pinch(0.5, -1)
 
     def enlarge(self, locator):
         """This function is used to replace the "pinch" method of appiumlibrary.
@@ -505,13 +981,16 @@ class iOSWDALibrary(object):
         Args:
         - _locator_
         """
-        element = self._find_element(locator)
-        element.pinch(2.0, 1)
+        with self._changing_screen():
+            element = self._find_element(locator)
+            element.pinch(2.0, 1)
 
     def find_image(self, screenshot, template, confidence=90, number=1):
+        # loads OpenCV, only import it when an image is searched
+        from RPA.recognition import templates
         info = templates.find(screenshot, template, confidence=confidence)
         info.sort()
-        print(info)
+        logger.debug("Template '%s' matches: %s" % (template, info))
         left = info[number-1].left
         right = info[number-1].right
         top = info[number-1].top
@@ -520,53 +999,82 @@ class iOSWDALibrary(object):
         y = int((top+bottom)/2)
         return {'x': x, 'y': y}
 
-    def drag_and_drop_by_element(self, ele1, ele2):
-        """ Drag from one element location to another element, default duration:5s.
+    def find_image_on_screen(self, template, confidence=90, number=1, region=None, locator=None):
+        """Finds ``template`` in a screenshot of the current screen and returns the center of the match.
+
+        The screenshot is taken from the session in memory and decoded templates are
+        cached until the template file changes. ``number`` selects the n-th best match.
+        The search can be limited to ``region`` (``x,y,width,height`` in screenshot
+        pixels) or to the bounds of the element identified by ``locator``.
+        Coordinates are returned in screenshot pixels, like `Find Image`.
+
+        Fails if there is no match with at least ``confidence`` percent.
+
+        Example:
+        | ${point} | Find Image On Screen | ${CURDIR}/icons/bell.png | confidence=85 | locator=name=toolbar |
+        """
+        point = self.__find_image_on_screen(template, confidence, number, region, locator)
+        if point is None:
+            raise AssertionError("Image '%s' not found on screen" % template)
+        logger.info("Image '%s' found at %s" % (template, point))
+        return point
+
+    def wait_until_image_appears(self, template, timeout='10s', confidence=90, region=None, locator=None):
+        """Waits until ``template`` is found on the screen and returns the center of the match.
+
+        Polls like `Wait Until Page Contains`. See `Find Image On Screen` for the arguments.
+
+        Example:
+        | ${point} | Wait Until Image Appears | ${CURDIR}/icons/done.png | timeout=5s |
+        """
+        found = []
+
+        def image_found():
+            found[:] = [self.__find_image_on_screen(template, confidence, 1, region, locator)]
+            return found[0] is not None
+        self._wait_until(image_found, timeout, "Image '%s' did not appear" % template)
+        return found[0]
+
+    def drag_and_drop_by_element(self, ele1, ele2, hold='5s', duration='2s'):
+        """ Drag from one element location to another element.
+
+        The first element is pressed for `hold`, then dragged to the second one in
+        `duration`. Both elements are located with one page source request when
+        their locators allow it.
 
         Args:
          - ele1 - origin element at which to start
          - ele2 - destination element at which to stop
+         - hold - how long the origin element is pressed before moving, default 5s
+         - duration - how long the move to the destination takes, default 2s
 
         Example:
         | Drag And Drop By Element | name=ic_shortcut_findmycar | name=ic_shortcut_caralarm |
+        | Drag And Drop By Element | name=ic_shortcut_findmycar | name=ic_shortcut_caralarm | hold=800ms | duration=300ms |
         """
-        ele1 = self._find_element(ele1).get(timeout=0)
-        ele1_x = int(ele1.bounds.x + ele1.bounds.width/2)
-        ele1_y = int(ele1.bounds.y + ele1.bounds.height/2)
-        ele2 = self._find_element(ele2).get(timeout=0)
-        ele2_x = int(ele2.bounds.x + ele2.bounds.width/2)
-        ele2_y = int(ele2.bounds.y + ele2.bounds.height/2)
-        data = {"actions": [{"action": "press","options": {"x": ele1_x,"y": ele1_y}},
-                    {"action": "wait","options": {"ms": 5000}},
-                    {"action": "moveTo","options": {"x": ele2_x,"y": ele2_y}},
-                    {"action": "wait","options": {"ms": 2000}},
-                    {"action": "release"}]}
-        r = self.client._session_http.post('/wda/touch/perform', data=data)
-        if not r["value"]:
-            raise AssertionError(r["value"]['message'])
+        self._gesture('drag', [ele1, ele2], _millis(hold), _millis(duration))
 
-    def drag_and_drop_by_coordinate(self, start_x, start_y, stop_x, stop_y):
-        """ Drag from one point to another point, default duration:5s.
+    def drag_and_drop_by_coordinate(self, start_x, start_y, stop_x, stop_y, hold='5s', duration='2s'):
+        """ Drag from one point to another point.
 
         Args:
          - start_x - x-coordinate at which to start
          - start_y - y-coordinate at which to start
-         - stop_x - x-coordinate distance from start_x at which to stop
-         - stop_y - y-coordinate distance from start_y at which to stop
+         - stop_x - x-coordinate at which to stop
+         - stop_y - y-coordinate at which to stop
+         - hold - how long the start point is pressed before moving, default 5s
+         - duration - how long the move to the stop point takes, default 2s
+
+        Coordinates can also be given in percent of the window or in screenshot
+        pixels, like with `Click A Point`.
 
         Example:
         | Drag And Drop By Coordinate | start_x=200 | start_y=200 | stop_x=300 | stop_y=300 |
         """
-        data = {"actions": [{"action": "press","options": {"x": int(start_x),"y": int(start_y)}},
-                    {"action": "wait","options": {"ms": 5000}},
-                    {"action": "moveTo","options": {"x": int(stop_x),"y": int(stop_y)}},
-                    {"action": "wait","options": {"ms": 2000}},
-                    {"action": "release"}]}
-        r = self.client._session_http.post('/wda/touch/perform', data=data)
-        if not r["value"]:
-            raise AssertionError(r["value"]['message'])
+        self._gesture('drag', ['%s,%s' % (start_x, start_y), '%s,%s' % (stop_x, stop_y)],
+                      _millis(hold), _millis(duration))
 
-    def narrow_by_coordinate(self, x1, y1, x2, y2):
+    def narrow_by_coordinate(self, x1, y1, x2, y2, duration='1s'):
         """ narrow screen by coordinate.
 
         Args:
@@ -574,45 +1082,19 @@ class iOSWDALibrary(object):
          - y1 - Y coordinate value of finger 1
          - x2 - X coordinate value of finger 2
          - y2 - Y coordinate value of finger 2
+         - duration - how long the fingers move, default 1s
+
+        Coordinates can also be given in percent of the window or in screenshot
+        pixels, like with `Click A Point`.
 
         Example:
         | Narrow By Coordinate | x1=200 | y1=200 | x2=300 | y2=300 |
         """
-        x1 = int(x1)
-        y1 = int(y1)
-        x2 = int(x2)
-        y2 = int(y2)
-        data = {"actions": 
-                    [
-                        {
-                        "type": "pointer",
-                        "id": "finger1",
-                        "parameters": {"pointerType": "touch"},
-                        "actions": [
-                            {"type": "pointerMove", "duration": 1000, "x": x1, "y": y1},
-                            {"type": "pointerDown"},
-                            {"type": "pointerMove", "duration": 1000, "x": x1*1.25, "y": y1*1.25},
-                            {"type": "pointerUp"},
-                            ],
-                        },
-                        {
-                        "type": "pointer",
-                        "id": "finger2",
-                        "parameters": {"pointerType": "touch"},
-                        "actions": [
-                            {"type": "pointerMove", "duration": 1000, "x": x2, "y": y2},
-                            {"type": "pointerDown"},
-                            {"type": "pointerMove", "duration": 1000, "x": x2*0.8, "y": y2*0.8},
-                            {"type": "pointerUp"},
-                            ],
-                        },
-                    ],
-                }
-        r = self.client._session_http.post('/actions', data=data)
-        if r["value"] != None:
-            raise AssertionError(r["value"]['message'])
+        (x1, y1), (x2, y2) = self._point(x1, y1), self._point(x2, y2)
+        paths = [[(x1, y1), (x1 * 1.25, y1 * 1.25)], [(x2, y2), (x2 * 0.8, y2 * 0.8)]]
+        self._gesture('swipe', [], paths, 0, _millis(duration))
 
-    def enlarge_by_coordinate(self, x1, y1, x2, y2):
+    def enlarge_by_coordinate(self, x1, y1, x2, y2, duration='1s'):
         """ enlarge screen by coordinate.
 
         Args:
@@ -620,43 +1102,93 @@ class iOSWDALibrary(object):
          - y1 - Y coordinate value of finger 1
          - x2 - X coordinate value of finger 2
          - y2 - Y coordinate value of finger 2
+         - duration - how long the fingers move, default 1s
+
+        Coordinates can also be given in percent of the window or in screenshot
+        pixels, like with `Click A Point`.
 
         Example:
         | Enlarge By Coordinate | x1=200 | y1=200 | x2=300 | y2=300 |
         """
-        x1 = int(x1)
-        y1 = int(y1)
-        x2 = int(x2)
-        y2 = int(y2)
-        data = {"actions": 
-                    [
-                        {
-                        "type": "pointer",
-                        "id": "finger1",
-                        "parameters": {"pointerType": "touch"},
-                        "actions": [
-                            {"type": "pointerMove", "duration": 1000, "x": x1, "y": y1},
-                            {"type": "pointerDown"},
-                            {"type": "pointerMove", "duration": 1000, "x": x1*0.8, "y": y1*0.8},
-                            {"type": "pointerUp"},
-                            ],
-                        },
-                        {
-                        "type": "pointer",
-                        "id": "finger2",
-                        "parameters": {"pointerType": "touch"},
-                        "actions": [
-                            {"type": "pointerMove", "duration": 1000, "x": x2, "y": y2},
-                            {"type": "pointerDown"},
-                            {"type": "pointerMove", "duration": 1000, "x": x2*1.25, "y": y2*1.25},
-                            {"type": "pointerUp"},
-                            ],
-                        },
-                    ],
-                }
-        r = self.client._session_http.post('/actions', data=data)
-        if r["value"] != None:
-            raise AssertionError(r["value"]['message'])
+        (x1, y1), (x2, y2) = self._point(x1, y1), self._point(x2, y2)
+        paths = [[(x1, y1), (x1 * 0.8, y1 * 0.8)], [(x2, y2), (x2 * 1.25, y2 * 1.25)]]
+        self._gesture('swipe', [], paths, 0, _millis(duration))
+
+    def start_gestures(self):
+        """Queues the following gestures until `Perform Gestures` sends them as one request.
+
+        Gesture keywords (`Tap`, `Long Press`, `Drag`, `Scroll`, `Pinch`, `Rotate`
+        and the drag, narrow and enlarge keywords) normally send one request
+        each. Queued gestures run one after the other in a single W3C actions
+        request, and all element targets are located with one page source request.
+
+        Example:
+        | Start Gestures |
+        | Tap | name=Edit |
+        | Drag | name=row1 | name=row5 | hold=800ms |
+        | Tap | name=Done |
+        | Perform Gestures |
+        """
+        self._gestures = []
+
+    def perform_gestures(self):
+        """Sends the gestures queued since `Start Gestures`."""
+        gestures, self._gestures = self._gestures or [], None
+        self._perform_gestures(gestures)
+
+    def tap(self, target, duration='100ms'):
+        """Taps `target`, an element locator or a point written ``x,y``.
+
+        Example:
+        | Tap | name=Buy |
+        | Tap | 120,300 | duration=50ms |
+        """
+        self._gesture('tap', [target], _millis(duration))
+
+    def long_press(self, target, duration='1s'):
+        """Presses `target`, an element locator or a point written ``x,y``, for `duration`."""
+        self._gesture('tap', [target], _millis(duration))
+
+    def drag(self, start, end, hold='0s', duration='500ms'):
+        """Presses `start` for `hold` and moves to `end` in `duration`.
+
+        `start` and `end` are element locators or points written ``x,y``.
+
+        Example:
+        | Drag | name=row1 | name=row5 | hold=800ms | duration=300ms |
+        """
+        self._gesture('drag', [start, end], _millis(hold), _millis(duration))
+
+    def scroll(self, target, offset_x=0, offset_y=-300, duration='300ms'):
+        """Flicks from `target`, an element locator or a point written ``x,y``, by the offset.
+
+        A negative `offset_y` moves the finger up, scrolling the content down.
+
+        Example:
+        | Scroll | name=list | offset_y=-500 |
+        """
+        self._gesture('scroll', [target], float(offset_x), float(offset_y), _millis(duration))
+
+    def pinch(self, target, scale=0.5, radius=100, duration='500ms'):
+        """Pinches with two fingers around `target`, an element locator or a point written ``x,y``.
+
+        The fingers start `radius` points away from the center and end at
+        `radius` times `scale`: a `scale` below 1 zooms out, above 1 zooms in.
+
+        Example:
+        | Pinch | name=map | scale=2 |
+        """
+        self._gesture('pinch', [target], float(scale), float(radius), _millis(duration))
+
+    def rotate(self, target, angle=90, radius=100, duration='500ms'):
+        """Rotates two fingers around `target`, an element locator or a point written ``x,y``.
+
+        `angle` is in degrees, positive clockwise.
+
+        Example:
+        | Rotate | name=map | angle=-45 |
+        """
+        self._gesture('rotate', [target], float(angle), float(radius), _millis(duration))
 
     def temp_wda_session(self, wda_url='http://127.0.0.1:8100', bundle_ID='com.daimler.ris.mercedesme.cn.ios.stage'):
         """Running iOS wda session without using stf api locally
@@ -670,31 +1202,442 @@ class iOSWDALibrary(object):
         | Temp WDA Session | wda_url=http://internalserver:port | boundle_ID=com.daimler.ris.mercedesme.cn.ios.stage |
         | Click Element    | name=更多 |
         """
-        self.client = wda.Client(wda_url)
-        self.client.wait_ready(timeout=10, noprint=False)
-        self.bundle_id = bundle_ID
-        self.session = self.client.session(bundle_ID)
-        time.sleep(3)
+        self._connect(wda_url, bundle_ID)
         self.wait_until_page_contains_element('name=ic_home_more')
-        time.sleep(2)
+        self.wait_until_page_is_stable()
         self.click_element('name=id_map_tab')
-        time.sleep(2)
+        self.wait_until_page_is_stable()
         self.narrow_by_coordinate("80", "150", "300", "600")
 
+    def configure_wda_transport(self, pool_size=4, connect_timeout='10s', read_timeout='180s', retries=2,
+                                failure_threshold=3, reset_timeout='30s', watchdog=None):
+        """Tunes the HTTP connections used to talk to WDA.
+
+        Applies to the next `Open Application` or `Temp WDA Session`.
+
+        Args:
+         - pool_size - number of kept-alive connections per WDA url
+         - connect_timeout - time to wait for the TCP connection
+         - read_timeout - time to wait for a response
+         - retries - retries, with a backoff of at most 2s, of GET requests that failed with a
+           transport error or a 502, 503 or 504 status and of any request that could not connect
+         - failure_threshold - requests failing that way in a row before the device is considered down
+         - reset_timeout - how long requests to a device that is down fail at once, without being sent
+         - watchdog - longest wait for WDA in any single request, even if asked for longer,
+           by default `read_timeout`
+
+        After `reset_timeout` the next request first checks that WDA answers on
+        /status, see `Check WDA Health`; if WDA lost the session meanwhile, a new
+        one is opened for the same application. A leased device that went down is
+        released as failed, see `Release Device`.
+
+        Example:
+        | Configure WDA Transport | pool_size=2 | connect_timeout=3s | read_timeout=60s | retries=1 |
+        | Configure WDA Transport | failure_threshold=2 | reset_timeout=1min | watchdog=30s |
+        | Open Application | wda_url=http://127.0.0.1:8100 | bundle_id=com.apple.Preferences |
+        """
+        self._transport = {
+            'pool_size': int(pool_size),
+            'connect_timeout': timestr_to_secs(connect_timeout),
+            'read_timeout': timestr_to_secs(read_timeout),
+            'retries': int(retries),
+            'failure_threshold': int(failure_threshold),
+            'reset_timeout': timestr_to_secs(reset_timeout),
+            'watchdog': timestr_to_secs(watchdog) if watchdog else None
+        }
+
+    def check_wda_health(self, timeout='5s'):
+        """Checks that WDA answers on /status within `timeout` and returns its state.
+
+        The result has ``ready``, the ``session_id`` WDA runs, whether it is the
+        session opened by this library (``session_alive``) and the response time
+        in ``seconds``. If WDA was considered down after failed requests (see
+        `Configure WDA Transport`) and is healthy again, requests are sent again
+        at once and a new session is opened if WDA lost ours.
+
+        Fails if WDA does not answer or is not ready.
+
+        Example:
+        | ${health} = | Check WDA Health | timeout=2s |
+        | Should Be True | ${health}[session_alive] |
+        """
+        start = time.time()
+        status = _wda_status(self._wda_url, timestr_to_secs(timeout))
+        if status is None:
+            raise AssertionError("WDA at '%s' did not answer in %s" % (self._wda_url, timeout))
+        if self._circuit is not None:
+            self._circuit.reset(status)
+        health = {'ready': status.get('ready', True) is not False,
+                  'session_id': status.get('sessionId'),
+                  'session_alive': self.session is not None and status.get('sessionId') == self.session.session_id,
+                  'seconds': round(time.time() - start, 3)}
+        logger.info("WDA at '%s': %s" % (self._wda_url, health))
+        if not health['ready']:
+            raise AssertionError("WDA at '%s' is not ready" % self._wda_url)
+        return health
+
+    def get_wda_transport_statistics(self):
+        """Returns latency statistics of WDA requests grouped by endpoint.
+
+        Each endpoint (e.g. ``GET /session/{id}/source``) maps to a dictionary with
+        ``count``, ``bytes`` and the ``p50``, ``p95`` and ``p99`` latencies in seconds.
+        The statistics are also written to the output directory at the end of every
+        suite, in ``wda-transport-stats-<suite id>.json``, e.g. ``wda-transport-stats-s1-s2.json``.
+
+        Example:
+        | ${stats} | Get WDA Transport Statistics |
+        """
+        return self._transport_stats.summary()
+
+    def reset_wda_transport_statistics(self):
+        """Clears the statistics returned by `Get WDA Transport Statistics`."""
+        self._transport_stats.reset()
+
+    def enable_profiler(self):
+        """Profiles the keywords of this library until `Disable Profiler`.
+
+        Each keyword call is timed and split into the time WDA takes to answer
+        (``device``, up to the first byte of the responses), the time spent
+        downloading responses (``network``), the time spent sleeping between
+        polls (``sleep``) and the rest (``other``, e.g. image matching), with
+        the number of WDA requests and bytes received.
+
+        At the end of every suite the calls are summed up by keyword, by locator
+        and by test into ``wda-profile-<suite id>.json`` and ``.html`` in the
+        output directory. The HTML report is linked from the suite metadata.
+        """
+        libraries = BuiltIn().get_library_instance(all=True)
+        self._profiler.libnames = set(name for name, library in libraries.items() if library is self)
+        self._profiler.enabled = True
+
+    def disable_profiler(self):
+        """Stops profiling keywords. See `Enable Profiler`."""
+        self._profiler.enabled = False
+
+    def register_devices(self, *wda_urls, pool_file=None, max_failures=3, quarantine='10min'):
+        """Adds WDA urls to the device pool used by `Lease Device`.
+
+        The pool is kept in ``pool_file`` (by default ``iOSWDALibrary-devices.json``
+        in the temporary directory), so parallel processes, e.g. pabot workers,
+        and threads of one process share the same devices. A device that fails
+        ``max_failures`` times in a row is not leased again for ``quarantine``.
+
+        A library instance drives one leased device at a time. Every pabot
+        worker has its own instance; threads of one process each need their own
+        ``iOSWDALibrary()``, registering the same ``pool_file``.
+
+        Example:
+        | Register Devices | http://127.0.0.1:8100 | http://127.0.0.1:8200 |
+        """
+        pool_file = pool_file or os.path.join(tempfile.gettempdir(), 'iOSWDALibrary-devices.json')
+        self._device_pool = _DevicePool(pool_file, int(max_failures), timestr_to_secs(quarantine))
+        self._device_pool.register(wda_urls)
+
+    def lease_device(self, bundle_id='com.daimler.ris.mercedesme.cn.ios.stage', timeout='10min', reuse_session=False):
+        """Leases a free device of the pool and opens ``bundle_id`` on it.
+
+        Waits up to ``timeout`` for a device to become free. Devices whose WDA does
+        not answer are released and counted as failed, and the next device is tried.
+        All other keywords then run against the leased device. Returns its WDA url.
+        A device leased before is released first, see `Release Device`.
+        See `Open Application` for `reuse_session`.
+
+        Example:
+        | [Setup] | Lease Device | bundle_id=com.apple.Preferences |
+        | [Teardown] | Release Device |
+        """
+        if self._device_pool is None:
+            raise RuntimeError("No devices registered, use 'Register Devices' first")
+        if self._leased_device is not None:
+            logger.info("Releasing device '%s' before leasing another one." % self._leased_device)
+            self.release_device()
+        deadline = time.time() + timestr_to_secs(timeout)
+        while True:
+            wda_url = self._device_pool.lease(deadline)
+            try:
+                self._connect(wda_url, bundle_id, is_truthy(reuse_session))
+            except Exception as e:
+                logger.warn("Device '%s' failed to start: %s" % (wda_url, e))
+                self._device_pool.release(wda_url, failed=True)
+                continue
+            self._leased_device = wda_url
+            logger.info("Leased device '%s'." % wda_url)
+            return wda_url
+
+    def release_device(self):
+        """Closes the session on the leased device and returns it to the pool.
+
+        The device is counted as failed if it went down while leased, see
+        `Configure WDA Transport`.
+        """
+        if self._leased_device is None:
+            return
+        failed = self._circuit is not None and self._circuit.trips > 0
+        try:
+            self._sessions.remove(self._wda_url, self.bundle_id)
+            self.session.close()
+        finally:
+            self._device_pool.release(self._leased_device, failed=failed)
+            self._leased_device = None
+
+    def start_wda_recording(self):
+        """Records every request sent to WDA and its response until `Stop WDA Recording`.
+
+        Start recording before `Open Application` to capture the whole session.
+        The recording can be served without a device by `Start WDA Replay Server`.
+        """
+        self._recorder = _TrafficRecorder()
+
+    def stop_wda_recording(self, path):
+        """Stops recording and writes the WDA traffic to the archive `path`, which is returned.
+
+        The archive is gzipped JSON. Each distinct response body, e.g. a page
+        source or a screenshot, is stored once.
+
+        Example:
+        | Start WDA Recording |
+        | Open Application | http://127.0.0.1:8100 | com.apple.Preferences |
+        | Click Text | General |
+        | Stop WDA Recording | ${OUTPUT DIR}/settings.wda.gz |
+        """
+        if self._recorder is None:
+            raise RuntimeError("WDA traffic is not being recorded, use 'Start WDA Recording' first")
+        recorder, self._recorder = self._recorder, None
+        recorder.save(path)
+        logger.info("Recorded %d WDA requests to '%s'." % (len(recorder.exchanges), path))
+        return path
+
+    def start_wda_replay_server(self, archive, latency=None, port=0):
+        """Serves a recording made with `Stop WDA Recording` as a WDA server and returns its url.
+
+        `latency` delays every response: a time string like ``50ms``, or
+        ``recorded`` to wait as long as the device took when recording. See
+        `WDAReplayServer` for how requests are matched.
+
+        Example:
+        | ${url} = | Start WDA Replay Server | ${CURDIR}/settings.wda.gz | latency=recorded |
+        | Open Application | ${url} | com.apple.Preferences |
+        """
+        self.stop_wda_replay_server()
+        self._replay_server = WDAReplayServer(archive, latency, int(port))
+        return self._replay_server.start()
+
+    def stop_wda_replay_server(self):
+        """Stops the server started by `Start WDA Replay Server`, if any."""
+        if self._replay_server is not None:
+            self._replay_server.stop()
+            self._replay_server = None
+
+    # listener
+    def _close(self):
+        self._screenshots.flush()
+        self.stop_screen_recording()
+        self.stop_wda_replay_server()
+        if self._leased_device is not None:
+            self._device_pool.release(self._leased_device)
+            self._leased_device = None
+
+    def _end_test(self, data, result):
+        if self._screen_recorder is None or not result.failed:
+            return
+        outdir = BuiltIn().get_variable_value('${OUTPUT DIR}')
+        path = os.path.join(outdir, 'wda-recording-%s.gif' % result.id)
+        if self._screen_recorder.save_gif(path):
+            message = result.message
+            message = message[6:].strip() if message.startswith('*HTML*') else html.escape(message, quote=False)
+            result.message = '*HTML* %s<br><a href="%s">Screen recording</a>' % (message, self._log_link(path))
+
+    def _end_suite(self, data, result):
+        self._screenshots.flush()
+        outdir = BuiltIn().get_variable_value('${OUTPUT DIR}')
+        summary = self._transport_stats.summary()
+        if summary:
+            with open(os.path.join(outdir, 'wda-transport-stats-%s.json' % result.id), 'w') as f:
+                json.dump(summary, f, indent=2)
+        if self._startup_times:
+            with open(os.path.join(outdir, 'wda-startup-times-%s.json' % result.id), 'w') as f:
+                json.dump(self._startup_times, f, indent=2)
+        report = self._profiler.write_report(result.longname, result.id, outdir)
+        if report is not None:
+            result.metadata['WDA Profile'] = '[%s|%s]' % (report, report)
+
     # private
+    def _connect(self, wda_url, bundle_id, reuse_session=False):
+        start = time.time()
+        self._configure_transport(wda_url)
+        self.client = wda.Client(wda_url)
+        status = self._wait_ready(self.client, wda_url, 10)
+        self._wda_url = wda_url
+        self.bundle_id = bundle_id
+        session_id = self._sessions.get(wda_url, bundle_id) if reuse_session else None
+        # WDA runs one session at a time, /status tells which one
+        reused = session_id is not None and session_id == status.get('sessionId')
+        if reused:
+            self.session = self._attach_session(session_id)
+            self.session.app_activate(bundle_id)
+        else:
+            self.session = self.client.session(bundle_id)
+            if reuse_session:
+                self._sessions.put(wda_url, bundle_id, self.session.session_id)
+        self._invalidate_snapshot()
+        self._screen_changed = time.time()
+        self._device_geometry = None
+        self._web_view = (None, 0)
+        if self._circuit is not None:
+            # failures while WDA starts up do not count
+            self._circuit.armed = True
+        elapsed = time.time() - start
+        self._startup_times.append({'wda_url': wda_url, 'bundle_id': bundle_id,
+                                    'seconds': round(elapsed, 3), 'reused': reused})
+        logger.info("Application '%s' started in %.3fs on '%s' with %s session."
+                    % (bundle_id, elapsed, wda_url, 'a reused' if reused else 'a new'))
+
+    def _attach_session(self, session_id):
+        """Returns a client on the running session `session_id`, set up like the ones `wda.Client.session` opens.
+
+        Those share the error callbacks of `self.client`, e.g. the one handling
+        an invalid session id.
+        """
+        session = wda.Client(self._wda_url, _session_id=session_id)
+        for event, callbacks in self.client.callbacks.items():
+            for callback in callbacks:
+                session.register_callback(event, callback)
+        return session
+
+    def _wait_ready(self, client, wda_url, timeout):
+        """Polls /status with a fast backoff until WDA answers and returns the status."""
+        deadline = time.time() + timeout
+        interval = self._poll_initial
+        while True:
+            try:
+                return client.status()
+            except Exception as e:
+                if time.time() >= deadline:
+                    raise AssertionError("WDA at '%s' is not ready in %s: %s"
+                                         % (wda_url, secs_to_timestr(timeout), e))
+            self._profiler.sleep(max(0, min(interval, deadline - time.time())))
+            interval = min(interval * 2, 1.0)
+
+    def _configure_transport(self, wda_url):
+        url = urlparse(wda_url)
+        http = wda._requests_session_pool_get(url.scheme, url.netloc)
+        self._circuit = None
+        if url.scheme in ('http', 'https'):
+            retry = _Retry(total=self._transport['retries'], backoff_factor=0.2,
+                           allowed_methods=frozenset(['GET']), status_forcelist=(502, 503, 504),
+                           raise_on_status=False)
+            self._circuit = _CircuitBreakerAdapter(wda_url, self._transport, self._recover_session,
+                                                   pool_connections=1, pool_maxsize=self._transport['pool_size'],
+                                                   max_retries=retry)
+            http.mount(url.scheme + '://', self._circuit)
+        if self._transport_stats.record not in http.hooks['response']:
+            http.hooks['response'].append(self._transport_stats.record)
+        if self._record_traffic not in http.hooks['response']:
+            http.hooks['response'].append(self._record_traffic)
+        # facebook-wda passes this module level timeout to every request
+        wda.HTTP_TIMEOUT = (self._transport['connect_timeout'], self._transport['read_timeout'])
+
+    def _recover_session(self, status):
+        """Opens a new session if WDA came back without ours and returns the old and new session ids.
+
+        It runs while a request is sent and facebook-wda sends one request per
+        device at a time, so the session is created without it.
+        """
+        if self.session is None or status.get('sessionId') == self.session.session_id:
+            return None
+        old_session_id = self.session.session_id
+        url = self._wda_url.rstrip('/') + '/session'
+        response = requests.post(url, json=_session_request(self.bundle_id), timeout=self._transport['read_timeout'])
+        result = _wda_result('POST', url, response.status_code, response.text)
+        self.session = self._attach_session(result.get('sessionId') or result['value']['sessionId'])
+        self._invalidate_snapshot()
+        self._device_geometry = None
+        logger.warn("WDA at '%s' lost session '%s', opened session '%s' for '%s'."
+                    % (self._wda_url, old_session_id, self.session.session_id, self.bundle_id))
+        return old_session_id, self.session.session_id
+
+    def _record_traffic(self, response, *args, **kwargs):
+        if self._recorder is not None:
+            self._recorder.record(response)
+
+    def __find_image_on_screen(self, template, confidence, number, region, locator):
+        import cv2
+        import numpy
+        png = self.session.screenshot(format='raw')
+        self._observe_screenshot(png)
+        screen = cv2.imdecode(numpy.frombuffer(png, numpy.uint8), cv2.IMREAD_GRAYSCALE)
+        left, top = 0, 0
+        if locator:
+            bounds = self._get_element(locator).bounds
+            scale = self._geometry().pixel_scale
+            region = (bounds.x * scale, bounds.y * scale, bounds.width * scale, bounds.height * scale)
+        elif region:
+            region = [int(float(v)) for v in region.split(',')]
+        if region:
+            left, top, width, height = [max(0, int(v)) for v in region]
+            screen = screen[top:top + height, left:left + width]
+        needle = _load_template(os.path.abspath(template), os.path.getmtime(template))
+        if screen.shape[0] < needle.shape[0] or screen.shape[1] < needle.shape[1]:
+            return None
+        scores = cv2.matchTemplate(screen, needle, cv2.TM_CCOEFF_NORMED)
+        height, width = needle.shape
+        for _ in range(int(number)):
+            _, score, _, (x, y) = cv2.minMaxLoc(scores)
+            if score < float(confidence) / 100:
+                return None
+            # hide this match so that the next best one is found elsewhere
+            scores[max(0, y - height // 2):y + height // 2 + 1, max(0, x - width // 2):x + width // 2 + 1] = -1
+        return {'x': left + x + width // 2, 'y': top + y + height // 2}
+
     def __get_text(self, locator):
-        element = self._find_element(locator).get(timeout=0)
+        element = self._get_element(locator)
         if element is not None:
-            if element.label is not None:
-                return element.label
-            if element.value is not None:
-                return element.value
+            label = element.label
+            if label is not None:
+                return label
+            return element.value
         return None
 
     def __is_text_present(self, text):
-        _xpath = u'//*[contains(@label,"{}") or contains(@value, "{}")]'.format(text, text)
+        if self._snapshot_enabled:
+            return self._page_snapshot().contains_text(text)
+        (_, predicate) = _presence_query('predicate', _text_predicate(text))
+        element = self._find_in_web_view(predicate)
+        if element is not None and element.exists:
+            return True
+        # a predicate query is answered natively, without serializing the page source
+        return self._find_by_predicate(predicate).exists
+
+    def __is_item_present(self, item, snapshot):
+        """Tells whether `item`, an element locator or a text, is on the page of `snapshot`."""
         try:
-            elements = self.session(xpath=_xpath).find_elements()
+            (prefix, _) = self._parse_locator(item)
+        except IndexError:
+            prefix = None
+        if prefix in self._strategies:
+            return self.__is_element_present(item, snapshot)
+        return snapshot.contains_text(item)
+
+    def __is_element_present(self, locator, snapshot=None):
+        """Tells whether an element matching `locator` is displayed, looking it up in `snapshot` if possible."""
+        (prefix, criteria) = self._parse_locator(locator)
+        if snapshot is not None and self._evaluates_on_source(prefix, criteria):
+            return any(_SnapshotElement(node).displayed for node in snapshot.find(prefix, criteria))
+        if self._is_local(prefix, criteria):
+            nodes = self._find_on_page_snapshot(prefix, criteria)
+            return any(_SnapshotElement(node).displayed for node in nodes)
+        try:
+            query = _presence_query(prefix, criteria)
+            if query is not None:
+                (using, value) = query
+                if using == 'predicate string':
+                    element = self._find_in_web_view(value)
+                    if element is not None and element.exists:
+                        return True
+                finder = {'predicate string': self._find_by_predicate, 'xpath': self._find_by_xpath,
+                          'class chain': self._find_by_class_chain}[using]
+                return finder(value).exists
+            elements = self._find_elements(locator)
             for i in elements:
                 if i.displayed:
                     return True
@@ -702,15 +1645,241 @@ class iOSWDALibrary(object):
         except wda.exceptions.WDAElementNotFoundError:
             return False
 
-    def __is_element_present(self, locator):
+    def _wait_until(self, condition, timeout, error, stable_time=None):
+        """Polls `condition` with exponential backoff until it is true.
+
+        `timeout` and `stable_time` are Robot Framework time strings. The deadline
+        includes the time spent in requests. On timeout `error`, or what it
+        returns if callable, is raised with the timeout appended.
+        """
+        poller = _Poller(timeout, error, stable_time, self._poll_initial, self._poll_max)
+        while True:
+            self._invalidate_snapshot()
+            delay = poller.next_delay(condition())
+            if delay is None:
+                return
+            self._profiler.sleep(delay)
+
+    def _scroll_until(self, find, target, container, direction, max_swipes, duration):
+        """Swipes until `find` returns an element from the page snapshot, see `Scroll Until Element Visible`."""
+        max_swipes = int(max_swipes)
+        if container is None:
+            geometry = self._geometry()
+            area = wda.Rect(0, 0, geometry.width, geometry.height)
+        else:
+            area = self._get_element(container).bounds
+        (start, end) = _scroll_path(area, direction.lower())
+        previous = None
+        for swipes in range(max_swipes + 1):
+            self._invalidate_snapshot()
+            snapshot = self._page_snapshot()
+            element = find(snapshot)
+            if element is not None:
+                logger.info("%s is visible after %d swipes." % (target, swipes))
+                return element
+            fingerprint = snapshot.fingerprint()
+            if fingerprint == previous:
+                raise AssertionError("%s is not visible, the content stopped moving after %d swipes"
+                                     % (target, swipes))
+            previous = fingerprint
+            if swipes < max_swipes:
+                self._perform_gestures([('drag', ['%d,%d' % start, '%d,%d' % end], (0, _millis(duration)))])
+        raise AssertionError("%s is not visible after %d swipes" % (target, max_swipes))
+
+    def _page_snapshot(self):
+        """Returns the cached page snapshot, or a fresh one when snapshot mode is disabled."""
+        if not self._snapshot_enabled:
+            return _PageSnapshot(self.session.source())
+        if self._snapshot is None or self._snapshot.age() > self._snapshot_ttl:
+            self._snapshot = _PageSnapshot(self.session.source())
+            self._observe_window(*self._snapshot.window_size())
+        return self._snapshot
+
+    def _invalidate_snapshot(self):
+        self._snapshot = None
+
+    @contextlib.contextmanager
+    def _changing_screen(self):
+        """Wraps an action on the screen, after which the page snapshot and older recorded frames are outdated.
+
+        The change is marked once the device answered, or failed, so that a
+        frame taken while the action runs is not used by `Capture Screenshot`.
+        """
         try:
+            yield
+        finally:
+            self._invalidate_snapshot()
+            self._screen_changed = time.time()
+
+    def _screenshot(self):
+        """Returns a screenshot, from the screen recording when it has a frame taken after the last action."""
+        if self._screen_recorder is not None:
+            frame = self._screen_recorder.frame_after(self._screen_changed, self._screen_recorder.interval)
+            if frame is not None:
+                return frame
+        png = self.session.screenshot(format='raw')
+        self._observe_screenshot(png)
+        return png
+
+    @staticmethod
+    def _log_link(path):
+        """Returns `path` relative to the log file, or to the working directory outside Robot Framework."""
+        try:
+            logfile = BuiltIn().get_variable_value('${LOG FILE}')
+            if logfile in (None, 'NONE'):
+                logfile = os.path.join(BuiltIn().get_variable_value('${OUTPUT DIR}'), 'log.html')
+        except RobotNotRunningError:
+            logfile = os.path.join(os.getcwd(), 'log.html')
+        return os.path.relpath(os.path.abspath(path), os.path.dirname(logfile)).replace(os.sep, '/')
+
+    def _geometry(self):
+        """Returns the `_DeviceGeometry` of the session, reading it on first use."""
+        if self._device_geometry is None:
+            size = self.session.window_size()
+            self._device_geometry = _DeviceGeometry(size.width, size.height, self.session.scale)
+        return self._device_geometry
+
+    def _point(self, x, y):
+        """Converts keyword coordinates to points, reading the geometry only for relative coordinates."""
+        if _DeviceGeometry.is_absolute(x) and _DeviceGeometry.is_absolute(y):
+            return float(x), float(y)
+        geometry = self._geometry()
+        return geometry.x(x), geometry.y(y)
+
+    def _observe_window(self, width, height):
+        """Forgets the cached geometry when a window of `width` x `height` points means the device rotated."""
+        if self._device_geometry is not None and self._device_geometry.rotated(width, height):
+            logger.info("Device orientation changed, reading its geometry again.")
+            self._device_geometry = None
+
+    def _observe_screenshot(self, png):
+        if self._device_geometry is not None:
+            (width, height) = struct.unpack('>II', png[16:24])
+            self._observe_window(width, height)
+            if self._device_geometry is not None:
+                self._device_geometry.pixel_width = width
+                self._device_geometry.pixel_height = height
+
+    def _get_element(self, locator):
+        """Returns the first element matching `locator`, from the page snapshot when enabled."""
+        return self._element_handle(locator, local=True).get()
+
+    def _element_handle(self, locator, local=False):
+        """Returns a lazy handle on the element matching `locator`.
+
+        With `local` the element is looked up on the page source, if enabled for
+        the locator; such a handle can only be read and clicked.
+        """
+        if local:
+            (prefix, criteria) = self._parse_locator(locator)
+            if self._is_local(prefix, criteria):
+                nodes = self._find_on_page_snapshot(prefix, criteria)
+                return _SnapshotElement(nodes[0] if nodes else None, self.session, locator)
+        return _ElementHandle(self._find_element(locator), locator)
+
+    def _elements_data(self, locator):
+        """Returns `_element_data` for all elements matching `locator`, from one page source when possible."""
+        (prefix, criteria) = self._parse_locator(locator)
+        if self._evaluates_on_source(prefix, criteria):
+            elements = [_SnapshotElement(node) for node in self._find_on_page_snapshot(prefix, criteria)]
+        else:
             elements = self._find_elements(locator)
-            for i in elements:
-                if i.displayed:
-                    return True
+        return [_element_data(element) for element in elements]
+
+    def _find_in_web_view(self, predicate):
+        """Returns a handle on the first element matching `predicate` inside a web view.
+
+        Returns None unless hybrid mode is enabled and the screen has a web view.
+        """
+        if self._hybrid_ttl is None:
+            return None
+        (has_web_view, checked) = self._web_view
+        if time.time() - checked > self._hybrid_ttl:
+            has_web_view = self._find_by_class_chain('**/XCUIElementTypeWebView').exists
+            self._web_view = (has_web_view, time.time())
+        if not has_web_view:
+            return None
+        steps = (('type', 'WebView'), ('predicate', predicate))
+        return _ElementHandle(self._find_by_chain(steps), 'type=WebView >> predicate=' + predicate)
+
+    def _is_local(self, prefix, criteria):
+        """Tells whether the locator is evaluated on the page source rather than by WDA."""
+        if not self._snapshot_enabled and not (self._local_xpath and prefix == 'xpath'):
             return False
-        except wda.exceptions.WDAElementNotFoundError:
+        return _PageSnapshot.supports(prefix, criteria)
+
+    def _evaluates_on_source(self, prefix, criteria):
+        """Tells whether the locator is evaluated on a page source that is fetched anyway, e.g. by a wait.
+
+        Xpath locators are only evaluated locally after `Enable Local XPath` or
+        `Enable Page Snapshot`, like with `_is_local`.
+        """
+        if prefix == 'xpath' and not (self._local_xpath or self._snapshot_enabled):
             return False
+        return _PageSnapshot.supports(prefix, criteria)
+
+    def _find_on_page_snapshot(self, prefix, criteria):
+        nodes = self._page_snapshot().find(prefix, criteria)
+        if self._verify_xpath and prefix == 'xpath':
+            self._verify_local_xpath(criteria, nodes)
+        return nodes
+
+    def _verify_local_xpath(self, xpath, nodes):
+        """Logs a warning when WDA evaluates `xpath` differently than the page source."""
+        elements = self._find_by_xpath(xpath).find_elements()
+        local = list(_SnapshotElement(nodes[0]).bounds) if nodes else None
+        device = [int(value) for value in elements[0].bounds] if elements else None
+        if len(elements) != len(nodes) or local != device:
+            logger.warn("XPath '%s' found %d elements at %s locally but %d at %s on the device."
+                        % (xpath, len(nodes), local, len(elements), device))
+
+    def _gesture(self, method, targets, *args):
+        """Runs the `_ActionChain` `method` on `targets`, or queues it after `Start Gestures`."""
+        if self._gestures is not None:
+            self._gestures.append((method, targets, args))
+        else:
+            self._perform_gestures([(method, targets, args)])
+
+    def _perform_gestures(self, gestures):
+        if not gestures:
+            return
+        points = self._gesture_points([target for (_, targets, _) in gestures for target in targets])
+        chain = _ActionChain()
+        for method, targets, args in gestures:
+            getattr(chain, method)(*[points[target] for target in targets] + list(args))
+        with self._changing_screen():
+            r = self.session._session_http.post('/actions', data=chain.payload())
+        if r["value"] != None:
+            raise AssertionError(r["value"]['message'])
+
+    def _gesture_points(self, targets):
+        """Maps every gesture target to a point.
+
+        Several elements are located with one page source when possible, a
+        single one with a find and a rect request, unless the page snapshot is
+        enabled.
+        """
+        points = {}
+        snapshot = None
+        elements = set(target for target in targets if _parse_point(target) is None)
+        from_source = self._snapshot_enabled or len(elements) > 1
+        for target in targets:
+            if target in points:
+                continue
+            point = _parse_point(target)
+            if point is not None:
+                point = self._point(*point)
+            else:
+                (prefix, criteria) = self._parse_locator(target)
+                if from_source and self._evaluates_on_source(prefix, criteria):
+                    snapshot = snapshot or self._page_snapshot()
+                    nodes = snapshot.find(prefix, criteria)
+                    element = _SnapshotElement(nodes[0] if nodes else None, locator=target).get()
+                else:
+                    element = self._element_handle(target).get()
+                point = element.bounds.center
+            points[target] = point
+        return points
 
     def _find_element(self, locator):
         (prefix, criteria) = self._parse_locator(locator)
@@ -729,15 +1898,7 @@ class iOSWDALibrary(object):
         return strategy(criteria).find_elements()
 
     def _parse_locator(self, locator: str):
-        try:
-            if '=' not in locator:
-                raise IndexError(f'"=" not in locator: {e}')
-            else:
-                using = locator.split('=')[0].strip('=').lower()
-                value = locator.split('=', 1)[1].strip()
-                return using, value
-        except Exception as e:
-            raise IndexError(f'Locator:[{locator}] Parameter error:{e}')
+        return _parse_locator(locator)
 
     # Strategy routines
     def _find_by_id(self, _value):
@@ -755,6 +1916,1552 @@ class iOSWDALibrary(object):
     def _find_by_value(self, _value):
         return self.session(value=_value)
 
+    def _find_by_predicate(self, _value):
+        return self.session(predicate=_value)
+
+    def _find_by_class_chain(self, _value):
+        return self.session(classChain=_value)
+
+    def _find_by_type(self, _value):
+        return self.session(type=_value)
+
+    def _find_by_label_contains(self, _value):
+        return self.session(labelContains=_value)
+
+    def _find_by_chain(self, _steps):
+        return self.session(classChain=_class_chain(_steps))
+
+
+class WDAReplayServer(object):
+    """Local WDA server answering with the traffic recorded by `iOSWDALibrary.stop_wda_recording`.
+
+    A request is answered with the responses recorded for the same method, path
+    and body, in the recorded order; the last one is repeated once they are
+    used up. Requests that were not recorded get a WDA ``unknown command`` error.
+
+    `latency` delays every response: seconds or a Robot Framework time string,
+    or ``recorded`` to wait as long as the device took when recording.
+
+    Example:
+        with WDAReplayServer('settings.wda.gz', latency='20ms') as url:
+            library.open_application(url, 'com.apple.Preferences')
+    """
+
+    def __init__(self, archive, latency=None, port=0):
+        with gzip.open(archive, 'rt', encoding='utf-8') as f:
+            recording = json.load(f)
+        self.responses = {}
+        for exchange in recording['exchanges']:
+            key = _TrafficRecorder.key(exchange['method'], exchange['path'], exchange['request'])
+            self.responses.setdefault(key, []).append(
+                (exchange['status'], recording['bodies'][exchange['response']], exchange['elapsed']))
+        self.latency = latency if latency in (None, 'recorded') else timestr_to_secs(latency)
+        self.port = port
+        self.unmatched = []
+        self._served = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Starts serving on a background thread and returns the server url."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, do not let them wait for an ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._reply()
+
+            do_POST = do_DELETE = do_GET
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else None
+                (status, content, elapsed) = replay.response(self.command, self.path, _TrafficRecorder.json(body))
+                if replay.latency == 'recorded':
+                    time.sleep(elapsed)
+                elif replay.latency:
+                    time.sleep(replay.latency)
+                content = content.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=UTF-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def response(self, method, path, request):
+        """Returns the status, body and recorded duration answering a request."""
+        key = _TrafficRecorder.key(method, path, request)
+        with self._lock:
+            responses = self.responses.get(key)
+            if not responses:
+                self.unmatched.append(key)
+                error = {'value': {'error': 'unknown command', 'message': 'Not recorded: %s %s' % (method, path)}}
+                return 404, json.dumps(error), 0
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            return responses[min(served, len(responses) - 1)]
+
+
+class AsyncIOSWDALibrary(object):
+    """Asyncio client for driving many devices from one event loop.
+
+    Methods mirror the keywords of `iOSWDALibrary` and are awaitable. All clients
+    can share one ``aiohttp.ClientSession`` passed as `http`, otherwise each
+    client opens its own. Requires ``aiohttp``.
+
+    The keywords send their requests with facebook-wda. Both clients check the
+    presence of texts and elements with the same WDA queries as the keywords
+    without `Enable Page Snapshot`, `Enable Local XPath` or `Enable Hybrid Mode`,
+    which the asyncio client does not have: ``xpath=`` locators are evaluated
+    by WDA. They wait with the same backoff and raise the same facebook-wda
+    exceptions for WDA errors. `get_text` reads locators other than ``xpath=``
+    from one page source instead of asking WDA for the element and its label.
+
+    Example:
+        async with aiohttp.ClientSession() as http:
+            phones = [AsyncIOSWDALibrary(url, http) for url in urls]
+            await asyncio.gather(*[p.open_application('com.apple.Preferences') for p in phones])
+            await asyncio.gather(*[p.click_text('General') for p in phones])
+    """
+    _parse_locator = iOSWDALibrary._parse_locator
+
+    def __init__(self, wda_url='http://127.0.0.1:8100', http=None, timeout='180s'):
+        self.wda_url = wda_url.rstrip('/')
+        self.bundle_id = None
+        self.session_id = None
+        self._http = http
+        self._own_http = http is None
+        self._timeout = timestr_to_secs(timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Closes the HTTP session if it was opened by this client."""
+        if self._own_http and self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def open_application(self, bundle_id='com.daimler.ris.mercedesme.cn.ios.stage'):
+        response = await self._request('POST', '/session', _session_request(bundle_id), with_session=False)
+        self.session_id = response.get('sessionId') or response['value']['sessionId']
+        self.bundle_id = bundle_id
+
+    async def close_application(self):
+        await self._request('DELETE', '/')
+
+    async def find_elements(self, locator):
+        """Returns the WDA element ids matching `locator`."""
+        (prefix, criteria) = self._parse_locator(locator)
+        return await self._find_element_ids(*self._query(prefix, criteria))
+
+    async def click_element(self, locator):
+        ids = await self.find_elements(locator)
+        if not ids:
+            raise WDAElementNotFoundError(f"Locator:{locator} not disppear!")
+        await self._click_element_id(ids[0])
+
+    async def click_text(self, text, exact_match=False):
+        ids = await self.find_elements('predicate=' + _text_predicate(text, exact_match))
+        if not ids:
+            raise WDAElementNotFoundError(f"Text:{text} not disppear!")
+        await self._click_element_id(ids[0])
+
+    async def click_a_point(self, x, y, duration=100):
+        if duration:
+            await self._request('POST', '/wda/touchAndHold', {'x': int(float(x)), 'y': int(float(y)),
+                                                              'duration': int(duration) / 1000})
+        else:
+            await self._request('POST', '/wda/tap/0', {'x': int(float(x)), 'y': int(float(y))})
+
+    async def swipe(self, start_x, start_y, offset_x, offset_y, duration=1000):
+        await self._request('POST', '/wda/dragfromtoforduration', {
+            'fromX': int(float(start_x)), 'fromY': int(float(start_y)),
+            'toX': int(float(offset_x)), 'toY': int(float(offset_y)), 'duration': int(duration) / 1000})
+
+    async def get_text(self, locator):
+        (prefix, criteria) = self._parse_locator(locator)
+        if prefix != 'xpath' and _PageSnapshot.supports(prefix, criteria):
+            nodes = _PageSnapshot(await self.page_source()).find(prefix, criteria)
+            if not nodes:
+                raise WDAElementNotFoundError("element not found", locator)
+            element = _SnapshotElement(nodes[0])
+            return element.label if element.label is not None else element.value
+        ids = await self.find_elements(locator)
+        if not ids:
+            raise WDAElementNotFoundError("element not found", locator)
+        label = (await self._request('GET', '/element/%s/attribute/label' % ids[0]))['value']
+        if label is not None:
+            return label
+        return (await self._request('GET', '/element/%s/attribute/value' % ids[0]))['value']
+
+    async def page_source(self):
+        response = await self._request('GET', '/source?format=xml', with_session=False)
+        return response['value']
+
+    async def is_text_present(self, text):
+        return len(await self._find_element_ids(*_presence_query('predicate', _text_predicate(text)))) > 0
+
+    async def is_element_present(self, locator):
+        (prefix, criteria) = self._parse_locator(locator)
+        query = _presence_query(prefix, criteria)
+        if query is None:
+            raise ValueError("Element locator with prefix '" + prefix + "' is not supported")
+        return len(await self._find_element_ids(*query)) > 0
+
+    async def page_should_contain_text(self, text):
+        if not await self.is_text_present(text):
+            raise AssertionError("Page should have contained text '%s' but did not" % text)
+
+    async def page_should_contain_element(self, locator):
+        if not await self.is_element_present(locator):
+            raise AssertionError("Page should have contained element '%s' but did not" % locator)
+
+    async def wait_until_page_contains(self, text, timeout='10s', stable_time=None):
+        await self._wait_until(lambda: self.is_text_present(str(text)), timeout,
+                               "Text '%s' did not appear" % text, stable_time)
+
+    async def wait_until_page_contains_element(self, locator, timeout='10s', stable_time=None):
+        await self._wait_until(lambda: self.is_element_present(locator), timeout,
+                               "Element '%s' did not appear" % locator, stable_time)
+
+    async def screenshot(self, filepath=None):
+        """Returns the PNG bytes of the screen, also written to `filepath` if given."""
+        response = await self._request('GET', '/screenshot', with_session=False)
+        png = base64.b64decode(response['value'])
+        if filepath:
+            with open(filepath, 'wb') as f:
+                f.write(png)
+        return png
+
+    async def window_size(self):
+        response = await self._request('GET', '/window/size')
+        return response['value']['width'], response['value']['height']
+
+    # private
+    async def _click_element_id(self, element_id):
+        rect = (await self._request('GET', '/element/%s/rect' % element_id))['value']
+        await self._request('POST', '/wda/tap/0', {'x': rect['x'] + rect['width'] // 2,
+                                                   'y': rect['y'] + rect['height'] // 2})
+
+    async def _find_element_ids(self, using, value):
+        response = await self._request('POST', '/elements', {'using': using, 'value': value})
+        return [element['ELEMENT'] for element in response['value']]
+
+    async def _wait_until(self, condition, timeout, error, stable_time=None):
+        import asyncio
+        poller = _Poller(timeout, error, stable_time)
+        while True:
+            delay = poller.next_delay(await condition())
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _query(prefix, criteria):
+        """Translates a locator into the `using`/`value` pair of WDA's /elements, like `wda.Selector`."""
+        if prefix in ('id', 'xpath'):
+            return prefix, criteria
+        if prefix == 'classchain':
+            return 'class chain', criteria
+        if prefix == 'chain':
+            return 'class chain', _class_chain(criteria)
+        predicate = _locator_predicate(prefix, criteria)
+        if predicate is None:
+            raise ValueError("Element locator with prefix '" + prefix + "' is not supported")
+        return 'predicate string', predicate
+
+    async def _request(self, method, urlpath, data=None, with_session=True):
+        if self._http is None:
+            import aiohttp
+            self._http = aiohttp.ClientSession()
+        url = self.wda_url + ('/session/' + self.session_id if with_session else '') + urlpath.rstrip('/')
+        async with self._http.request(method, url, json=data, timeout=self._timeout) as response:
+            return _wda_result(method, url, response.status, await response.text())
+
+
+def _session_request(bundle_id):
+    """Returns the body of the POST /session launching `bundle_id`, as sent by facebook-wda."""
+    always_match = {'bundleId': bundle_id, 'arguments': [], 'environment': {}, 'shouldWaitForQuiescence': False}
+    return {'capabilities': {'alwaysMatch': always_match}, 'desiredCapabilities': always_match}
+
+
+def _wda_result(method, url, status_code, text):
+    """Decodes the answer of WDA to a request sent without facebook-wda.
+
+    Errors raise the exceptions facebook-wda raises for them.
+    """
+    if status_code == 502:
+        raise wda.WDABadGateway(status_code, text)
+    try:
+        result = json.loads(text)
+    except ValueError:
+        if text == '':
+            raise wda.WDAEmptyResponseError(method, url, None)
+        raise wda.WDAError(method, url, text[:100] + '...')
+    value = result.get('value')
+    if isinstance(value, dict) and value.get('error'):
+        value = dict(value)
+        value.pop('traceback', None)
+        for error in (wda.WDAInvalidSessionIdError, wda.WDAPossiblyCrashedError,
+                      wda.WDAKeyboardNotPresentError, wda.WDAUnknownError, WDAStaleElementReferenceError):
+            if error.check(value):
+                raise error(wda.Status.ERROR, value)
+        raise wda.WDARequestError(wda.Status.ERROR, value)
+    return result
+
+
+class _Poller(object):
+    """Deadline, backoff and stable time of one wait, in `iOSWDALibrary` and `AsyncIOSWDALibrary`.
+
+    `timeout` and `stable_time` are Robot Framework time strings. The deadline
+    includes the time spent in requests. Polls start `initial` seconds apart,
+    with jitter, and back off up to `maximum`.
+    """
+
+    def __init__(self, timeout, error, stable_time=None, initial=0.05, maximum=0.5):
+        self.timeout = timestr_to_secs(timeout)
+        self.stable_time = timestr_to_secs(stable_time) if stable_time else 0
+        self.error = error
+        self.start = time.time()
+        self.deadline = self.start + self.timeout
+        self.interval = initial
+        self.maximum = maximum
+        self.polls = 0
+        self.satisfied_since = None
+
+    def next_delay(self, satisfied):
+        """Returns how long to sleep before the next poll, or None once the condition held long enough.
+
+        Raises AssertionError with `error`, or what it returns if callable, when
+        the timeout is over.
+        """
+        self.polls += 1
+        now = time.time()
+        if satisfied:
+            self.satisfied_since = now if self.satisfied_since is None else self.satisfied_since
+            if now - self.satisfied_since >= self.stable_time:
+                logger.info("Condition met after %d polls in %.3fs." % (self.polls, now - self.start))
+                return None
+        else:
+            self.satisfied_since = None
+        if now >= self.deadline:
+            logger.info("Condition not met after %d polls in %.3fs." % (self.polls, now - self.start))
+            error = self.error() if callable(self.error) else self.error
+            raise AssertionError("%s in %s" % (error, secs_to_timestr(self.timeout)))
+        delay = self.interval * random.uniform(0.5, 1.0)
+        if self.satisfied_since is not None:
+            delay = min(delay, self.satisfied_since + self.stable_time - now)
+        self.interval = min(self.interval * 1.5, self.maximum)
+        return max(0, min(delay, self.deadline - now))
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_locator(locator):
+    """Splits a locator into its lower-cased prefix and criteria, cached per locator string.
+
+    A chain like ``type=Cell >> name=Buy`` is returned as ``('chain', steps)``
+    with one ``(prefix, criteria)`` pair per step.
+    """
+    steps = _split_chain(locator)
+    if len(steps) > 1:
+        return 'chain', tuple(_parse_locator(step.strip()) for step in steps)
+    if '=' not in locator:
+        raise IndexError(f'Locator:[{locator}] Parameter error:"=" not in locator')
+    using, value = locator.split('=', 1)
+    return using.strip().lower(), value.strip()
+
+
+_chain_step = re.compile(r'\s*(id|name|xpath|label|value|text|predicate|classchain|type|labelcontains|index)\s*=',
+                         re.IGNORECASE)
+
+
+def _split_chain(locator):
+    """Splits a locator at the `` >> `` that are followed by a prefix.
+
+    In predicate, class chain and xpath steps, `` >> `` inside quotes is part of the query.
+    """
+    steps = []
+    (start, quote, escaped) = (0, None, False)
+    step = _chain_step.match(locator)
+    quoting = step is not None and step.group(1).lower() in ('predicate', 'classchain', 'xpath')
+    for i, char in enumerate(locator):
+        if quote is not None:
+            if not escaped and char == quote:
+                quote = None
+            escaped = not escaped and char == '\\'
+        elif quoting and char in '"\'`':
+            quote = char
+        elif locator.startswith(' >> ', i):
+            step = _chain_step.match(locator, i + 4)
+            if step is not None:
+                steps.append(locator[start:i])
+                start = i + 4
+                quoting = step.group(1).lower() in ('predicate', 'classchain', 'xpath')
+    return steps + [locator[start:]]
+
+
+def _quote_items(items):
+    return ', '.join("'%s'" % item for item in items)
+
+
+def _quote_predicate(text):
+    return u'"%s"' % text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _text_predicate(text, exact_match=False):
+    """Predicate matching elements whose label or value contains, or equals, `text`."""
+    operator = '==' if exact_match else 'CONTAINS'
+    return u'label {0} {1} OR value {0} {1}'.format(operator, _quote_predicate(text))
+
+
+def _locator_predicate(prefix, criteria):
+    """Translates a locator into an iOS predicate, or returns None if it has none."""
+    if prefix == 'predicate':
+        return criteria
+    if prefix == 'type':
+        return u'type == %s' % _quote_predicate('XCUIElementType' + criteria)
+    if prefix == 'labelcontains':
+        return u'label CONTAINS %s' % _quote_predicate(criteria)
+    attribute = _PageSnapshot._attributes.get(prefix)
+    if attribute is None:
+        return None
+    return u'%s == %s' % (attribute, _quote_predicate(criteria))
+
+
+def _presence_query(prefix, criteria):
+    """Returns the WDA ``using`` and ``value`` finding the displayed elements matching a locator.
+
+    WDA filters on visibility itself, so that checking the presence of an
+    element stays one request however many elements match. Returns None for
+    locators WDA can not query that way.
+    """
+    predicate = _locator_predicate(prefix, criteria)
+    if predicate is not None:
+        return 'predicate string', u'(%s) AND visible == 1' % predicate
+    if prefix == 'xpath':
+        return 'xpath', u'({})[@visible="true"]'.format(criteria)
+    if prefix in ('classchain', 'chain'):
+        return 'class chain', (criteria if prefix == 'classchain' else _class_chain(criteria)) + '[`visible == 1`]'
+    return None
+
+
+def _class_chain(steps):
+    """Builds one class chain query out of the steps of a chained locator.
+
+    Every step is searched among the descendants of the previous one, an
+    ``index=N`` step picks the N-th (0 based, negative from the end) match of
+    the step before it.
+    """
+    chain = []
+    for prefix, criteria in steps:
+        if prefix == 'index':
+            if not chain:
+                raise ValueError("Locator chain can not start with 'index'")
+            index = int(criteria)
+            chain[-1] += '[%d]' % (index + 1 if index >= 0 else index)
+        elif prefix == 'classchain':
+            chain.append(criteria[3:] if criteria.startswith('**/') else criteria)
+        elif prefix == 'type':
+            chain.append('XCUIElementType' + criteria)
+        else:
+            predicate = _locator_predicate(prefix, criteria)
+            if predicate is None:
+                raise ValueError("Element locator with prefix '" + prefix + "' can not be chained")
+            chain.append('XCUIElementTypeAny[`%s`]' % predicate)
+    return '**/' + '/**/'.join(chain)
+
+
+def _element_data(element):
+    """Returns the properties of a `wda.Element` or `_SnapshotElement` as a dictionary."""
+    bounds = element.bounds
+    return {'label': element.label,
+            'value': element.value,
+            'name': element.name,
+            'type': element.className,
+            'rect': {'x': bounds.x, 'y': bounds.y, 'width': bounds.width, 'height': bounds.height},
+            'visible': bool(element.visible),
+            'enabled': bool(element.enabled)}
+
+
+def _scroll_path(bounds, direction):
+    """Returns the start and end points of a swipe showing what is `direction` of `bounds`."""
+    try:
+        (dx, dy) = {'down': (0, -1), 'up': (0, 1), 'right': (-1, 0), 'left': (1, 0)}[direction]
+    except KeyError:
+        raise ValueError("Direction must be 'down', 'up', 'left' or 'right', got '%s'" % direction)
+    (x, y) = (bounds.x + bounds.width / 2, bounds.y + bounds.height / 2)
+    (half_width, half_height) = (bounds.width * 0.3, bounds.height * 0.3)
+    return (x - dx * half_width, y - dy * half_height), (x + dx * half_width, y + dy * half_height)
+
+
+def _millis(time_string):
+    return int(round(timestr_to_secs(time_string) * 1000))
+
+
+def _parse_point(target):
+    """Returns the (x, y) of a gesture target written ``x,y``, or None for an element locator."""
+    if '=' in target:
+        return None
+    try:
+        x, y = target.split(',')
+        _DeviceGeometry.convert(x, 1, 1)
+        _DeviceGeometry.convert(y, 1, 1)
+        return x.strip(), y.strip()
+    except ValueError:
+        raise ValueError("Gesture target '%s' is neither a locator nor a point written 'x,y'" % target)
+
+
+def _ensure_recursion_limit(limit=2000):
+    """Raises the recursion limit to `limit` for deep page sources, never lowering it."""
+    if sys.getrecursionlimit() < limit:
+        sys.setrecursionlimit(limit)
+
+
+@functools.lru_cache(maxsize=None)
+def _lxml_etree():
+    """Returns ``lxml.etree`` if it is installed, None otherwise."""
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+    return etree
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_xpath(xpath):
+    """Compiles `xpath` for page source nodes, or returns None if it can not be evaluated locally.
+
+    ``lxml`` evaluates any XPath 1.0 expression, ElementTree only a subset of
+    the ones starting with ``//``.
+    """
+    etree = _lxml_etree()
+    if etree is not None:
+        try:
+            return etree.XPath(xpath)
+        except etree.XPathSyntaxError:
+            return None
+    if not xpath.startswith('//'):
+        return None
+    try:
+        ElementTree.Element('AppiumAUT').findall('.' + xpath)
+    except (SyntaxError, KeyError):
+        return None
+    return operator.methodcaller('findall', '.' + xpath)
+
+
+@functools.lru_cache(maxsize=64)
+def _load_template(path, mtime):
+    """Decodes a template image, cached per path and modification time."""
+    import cv2
+    template = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if template is None:
+        raise ValueError("Template '%s' is not a readable image" % path)
+    return template
+
+
+class _ScreenshotWriter(object):
+    """Encodes and writes screenshots, optionally on a background thread."""
+    _extensions = {'png': '.png', 'jpeg': '.jpg', 'webp': '.webp'}
+
+    def __init__(self):
+        self.configure('png', 80, 0, False, False)
+        self._queue = queue.Queue(maxsize=16)
+        self._worker = None
+
+    def configure(self, image_format, quality, thumbnail_width, background, dedupe):
+        self.image_format = image_format
+        self.quality = quality
+        self.thumbnail_width = thumbnail_width
+        self.background = background
+        self.dedupe = dedupe
+        self._last = None
+
+    def save(self, png, filepath):
+        """Stores the PNG bytes from WDA and returns the paths of the image and its thumbnail."""
+        if self.image_format != 'png':
+            filepath = os.path.splitext(filepath)[0] + self._extensions[self.image_format]
+        thumbnail = os.path.splitext(filepath)[0] + '.thumb.jpg' if self.thumbnail_width else None
+        digest = hashlib.sha1(png).hexdigest()
+        if self.dedupe and self._last and self._last[0] == digest:
+            logger.info("Screenshot is identical to '%s'." % self._last[1])
+            return self._last[1:]
+        self._last = (digest, filepath, thumbnail)
+        job = (png, filepath, self.image_format, self.quality, thumbnail, self.thumbnail_width)
+        if not self.background:
+            self._write(*job)
+            return filepath, thumbnail
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='wda-screenshots', daemon=True)
+            self._worker.start()
+        # blocks when the writer falls behind, so memory stays bounded
+        self._queue.put(job)
+        return filepath, thumbnail
+
+    def flush(self):
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._write(*job)
+            except Exception as e:
+                logger.warn("Writing screenshot '%s' failed: %s" % (job[1], e))
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(png, filepath, image_format, quality, thumbnail_path, thumbnail_width):
+        # frames of a screen recording may be JPEG
+        is_png = png.startswith(b'\x89PNG')
+        if image_format == 'png' and is_png:
+            with open(filepath, 'wb') as f:
+                f.write(png)
+        if image_format == 'png' and is_png and not thumbnail_path:
+            return
+        from PIL import Image
+        image = Image.open(io.BytesIO(png)).convert('RGB')
+        if image_format != 'png' or not is_png:
+            image.save(filepath, format=image_format.upper(), quality=quality)
+        if thumbnail_path:
+            image.thumbnail((thumbnail_width, image.height * thumbnail_width // image.width))
+            image.save(thumbnail_path, format='JPEG', quality=70)
+
+
+class _ScreenRecorder(object):
+    """Keeps the screen frames of the last seconds in memory.
+
+    Frames are read on a background thread from the WDA MJPEG server, or by
+    polling screenshots with a connection of their own.
+    """
+
+    def __init__(self, wda_url, fps, buffer_seconds, mjpeg_url=None):
+        self.interval = 1.0 / fps
+        self.error = None
+        self._wda_url = wda_url.rstrip('/')
+        self._mjpeg_url = mjpeg_url
+        self._frames = collections.deque(maxlen=max(1, int(math.ceil(buffer_seconds * fps))))
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._http = requests.Session()
+        self._thread = threading.Thread(target=self._run, name='wda-screen-recorder', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        # unblocks a stream read
+        self._http.close()
+        self._thread.join(5)
+
+    def _run(self):
+        try:
+            for taken, frame in (self._stream() if self._mjpeg_url else self._poll()):
+                with self._condition:
+                    self._frames.append((taken, frame))
+                    self._condition.notify_all()
+        except Exception as e:
+            if not self._stopped.is_set():
+                self.error = e
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            taken = time.time()
+            response = self._http.get(self._wda_url + '/screenshot', timeout=30)
+            response.raise_for_status()
+            yield taken, base64.b64decode(response.json()['value'])
+            self._stopped.wait(max(0, taken + self.interval - time.time()))
+
+    def _stream(self):
+        """Yields the JPEG frames of the MJPEG stream, at most one per interval."""
+        with self._http.get(self._mjpeg_url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            data = bytearray()
+            last = 0
+            for chunk in response.iter_content(16384):
+                if self._stopped.is_set():
+                    return
+                data.extend(chunk)
+                while True:
+                    # every part is a boundary line and headers including Content-Length, then the JPEG
+                    header_end = data.find(b'\r\n\r\n')
+                    if header_end < 0:
+                        break
+                    length = re.search(br'content-length:\s*(\d+)', data[:header_end], re.IGNORECASE)
+                    if length is None:
+                        del data[:header_end + 4]
+                        continue
+                    end = header_end + 4 + int(length.group(1))
+                    if len(data) < end:
+                        break
+                    frame = bytes(data[header_end + 4:end])
+                    del data[:end]
+                    if time.time() - last >= self.interval:
+                        last = time.time()
+                        yield last, frame
+
+    def frame_after(self, since, timeout):
+        """Returns the latest frame if it was taken after `since`, waiting up to `timeout` for one."""
+        deadline = time.time() + timeout
+        with self._condition:
+            while not self._frames or self._frames[-1][0] < since:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self._thread.is_alive():
+                    return None
+                self._condition.wait(remaining)
+            return self._frames[-1][1]
+
+    def frames(self, seconds=None):
+        """Returns the (time, frame) pairs of the last `seconds`, all by default."""
+        with self._condition:
+            frames = list(self._frames)
+        if seconds is not None:
+            frames = [(taken, frame) for (taken, frame) in frames if taken >= time.time() - seconds]
+        return frames
+
+    def save_gif(self, path, seconds=None, width=320):
+        """Writes the recorded frames to `path` as an animated GIF, returning False if there are none."""
+        from PIL import Image
+        frames = self.frames(seconds)
+        if not frames:
+            return False
+        images = []
+        for _, frame in frames:
+            image = Image.open(io.BytesIO(frame)).convert('RGB')
+            image.thumbnail((width, image.height * width // image.width))
+            images.append(image)
+        durations = [max(20, int((b[0] - a[0]) * 1000)) for (a, b) in zip(frames, frames[1:])] + [1000]
+        images[0].save(path, format='GIF', save_all=True, append_images=images[1:], duration=durations, loop=0)
+        return True
+
+
+_file_locks = {}
+
+
+@contextlib.contextmanager
+def _locked_json(path):
+    """Yields the dictionary stored in the JSON file `path`, saved back on exit.
+
+    The file is locked against other threads and processes meanwhile.
+    """
+    with _file_locks.setdefault(path, threading.Lock()):
+        lock_file = path + '.lock'
+        while True:
+            try:
+                fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                # a process died while holding the lock
+                try:
+                    if time.time() - os.path.getmtime(lock_file) > 10:
+                        os.remove(lock_file)
+                except OSError:
+                    pass
+                time.sleep(0.05)
+        try:
+            content = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    content = json.load(f)
+            yield content
+            with open(path, 'w') as f:
+                json.dump(content, f, indent=2)
+        finally:
+            os.close(fd)
+            os.remove(lock_file)
+
+
+class _SessionRegistry(object):
+    """WDA session ids by WDA url and bundle id, shared by processes through a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, wda_url, bundle_id):
+        with _locked_json(self.path) as sessions:
+            return sessions.get('%s %s' % (wda_url, bundle_id))
+
+    def put(self, wda_url, bundle_id, session_id):
+        with _locked_json(self.path) as sessions:
+            sessions['%s %s' % (wda_url, bundle_id)] = session_id
+
+    def remove(self, wda_url, bundle_id):
+        if not os.path.exists(self.path):
+            return
+        with _locked_json(self.path) as sessions:
+            sessions.pop('%s %s' % (wda_url, bundle_id), None)
+
+
+class _DevicePool(object):
+    """Device leases shared by threads and processes through a JSON file."""
+
+    def __init__(self, path, max_failures, quarantine):
+        self.path = path
+        self.max_failures = max_failures
+        self.quarantine = quarantine
+
+    def register(self, wda_urls):
+        with self._locked() as devices:
+            for wda_url in wda_urls:
+                devices.setdefault(wda_url, {'owner': None, 'failures': 0, 'quarantined_until': 0})
+
+    def lease(self, deadline):
+        owner = '%d:%d' % (os.getpid(), threading.get_ident())
+        interval = 0.1
+        while True:
+            with self._locked() as devices:
+                for wda_url, device in devices.items():
+                    if device['owner'] and self._owner_alive(device['owner']):
+                        continue
+                    if device['quarantined_until'] > time.time():
+                        continue
+                    device['owner'] = owner
+                    return wda_url
+            if time.time() > deadline:
+                raise AssertionError("No free device in '%s'" % self.path)
+            time.sleep(interval)
+            interval = min(interval * 2, 2.0)
+
+    def release(self, wda_url, failed=False):
+        with self._locked() as devices:
+            device = devices[wda_url]
+            device['owner'] = None
+            device['failures'] = device['failures'] + 1 if failed else 0
+            if device['failures'] >= self.max_failures:
+                logger.warn("Device '%s' quarantined for %s" % (wda_url, secs_to_timestr(self.quarantine)))
+                device['quarantined_until'] = time.time() + self.quarantine
+                device['failures'] = 0
+
+    @staticmethod
+    def _owner_alive(owner):
+        pid = int(owner.split(':')[0])
+        # os.kill terminates the process on Windows, leases are only freed on release there
+        if pid == os.getpid() or os.name == 'nt':
+            return True
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def _locked(self):
+        return _locked_json(self.path)
+
+
+class _DeviceGeometry(object):
+    """Window size, scale factor, screenshot size and orientation of a device.
+
+    Converts coordinates written in points (``120``), in percent of the window
+    (``25%``) or in screenshot pixels (``240px``) to points.
+    """
+
+    def __init__(self, width, height, scale):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.pixel_width = width * scale
+        self.pixel_height = height * scale
+
+    @property
+    def orientation(self):
+        return 'LANDSCAPE' if self.width > self.height else 'PORTRAIT'
+
+    @property
+    def pixel_scale(self):
+        """Screenshot pixels per point."""
+        return self.pixel_width / float(self.width)
+
+    def rotated(self, width, height):
+        """Tells whether a screen of `width` x `height` has the other orientation."""
+        return width != height and (width > height) != (self.width > self.height)
+
+    def x(self, value):
+        return self.convert(value, self.width, self.pixel_width)
+
+    def y(self, value):
+        return self.convert(value, self.height, self.pixel_height)
+
+    @staticmethod
+    def is_absolute(value):
+        return not str(value).strip().endswith(('%', 'px'))
+
+    @staticmethod
+    def convert(value, points, pixels):
+        value = str(value).strip()
+        if value.endswith('%'):
+            return float(value[:-1]) * points / 100
+        if value.endswith('px'):
+            return float(value[:-2]) * points / pixels
+        return float(value)
+
+    def as_dict(self):
+        return {'width': self.width, 'height': self.height, 'scale': self.scale,
+                'pixel_width': self.pixel_width, 'pixel_height': self.pixel_height,
+                'orientation': self.orientation}
+
+
+class _ActionChain(object):
+    """Builds one W3C actions request out of touch gestures run one after the other.
+
+    Every finger is a touch pointer input source. WDA runs the actions of all
+    sources tick by tick, so after each gesture the fingers are padded with
+    pauses to the same number of ticks. Durations are in milliseconds.
+    """
+
+    def __init__(self):
+        self._fingers = []
+
+    def swipe(self, paths, hold, duration):
+        """Puts one finger on the first point of each path, holds, then moves them all along their path."""
+        ticks = len(self._fingers[0]) if self._fingers else 0
+        while len(self._fingers) < len(paths):
+            self._fingers.append([{'type': 'pause', 'duration': 0} for _ in range(ticks)])
+        for index, path in enumerate(paths):
+            actions = self._fingers[index]
+            (x, y) = path[0]
+            actions.append({'type': 'pointerMove', 'duration': 0, 'x': round(x), 'y': round(y)})
+            actions.append({'type': 'pointerDown', 'button': 0})
+            if hold:
+                actions.append({'type': 'pause', 'duration': hold})
+            for (x, y) in path[1:]:
+                actions.append({'type': 'pointerMove', 'duration': duration // (len(path) - 1),
+                                'x': round(x), 'y': round(y)})
+            actions.append({'type': 'pointerUp', 'button': 0})
+        ticks = max(len(actions) for actions in self._fingers)
+        for actions in self._fingers:
+            actions.extend({'type': 'pause', 'duration': 0} for _ in range(ticks - len(actions)))
+        return self
+
+    def tap(self, point, duration):
+        return self.swipe([[point]], duration, 0)
+
+    def drag(self, start, end, hold, duration):
+        return self.swipe([[start, end]], hold, duration)
+
+    def scroll(self, point, offset_x, offset_y, duration):
+        return self.drag(point, (point[0] + offset_x, point[1] + offset_y), 0, duration)
+
+    def pinch(self, center, scale, radius, duration):
+        (x, y) = center
+        return self.swipe([[(x - radius, y), (x - radius * scale, y)],
+                           [(x + radius, y), (x + radius * scale, y)]], 0, duration)
+
+    def rotate(self, center, angle, radius, duration):
+        # pointer moves are straight lines, follow the arc in steps of 15 degrees
+        steps = max(1, int(math.ceil(abs(angle) / 15.0)))
+        paths = []
+        for start in (0, 180):
+            paths.append([(center[0] + radius * math.cos(math.radians(start + angle * step / steps)),
+                           center[1] + radius * math.sin(math.radians(start + angle * step / steps)))
+                          for step in range(steps + 1)])
+        return self.swipe(paths, 0, duration)
+
+    def payload(self):
+        return {'actions': [{'type': 'pointer', 'id': 'finger%d' % (index + 1),
+                             'parameters': {'pointerType': 'touch'}, 'actions': actions}
+                            for index, actions in enumerate(self._fingers)]}
+
+
+class _TrafficRecorder(object):
+    """Requests and responses exchanged with WDA, saved as a gzipped JSON archive."""
+
+    def __init__(self):
+        self.start = time.time()
+        self.exchanges = []
+        self.bodies = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def json(body):
+        if not body:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+
+    @staticmethod
+    def key(method, path, request):
+        return '%s %s %s' % (method, path, json.dumps(request, sort_keys=True))
+
+    def record(self, response):
+        url = urlparse(response.request.url)
+        content = response.content.decode('utf-8', 'replace')
+        digest = hashlib.sha1(response.content).hexdigest()
+        with self._lock:
+            self.bodies[digest] = content
+            self.exchanges.append({
+                'time': round(time.time() - self.start, 3),
+                'method': response.request.method,
+                'path': url.path + ('?' + url.query if url.query else ''),
+                'request': self.json(response.request.body),
+                'status': response.status_code,
+                'response': digest,
+                'elapsed': round(response.elapsed.total_seconds(), 4)
+            })
+
+    def save(self, path):
+        with self._lock:
+            recording = {'version': 1, 'exchanges': self.exchanges, 'bodies': self.bodies}
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                json.dump(recording, f, separators=(',', ':'))
+
+
+def _wda_status(wda_url, timeout):
+    """Returns the /status value of WDA with its ``sessionId``, or None if it does not answer in `timeout`."""
+    try:
+        # a connection of its own, not held up by a pool of stalled requests
+        response = requests.get(wda_url.rstrip('/') + '/status', timeout=timeout)
+        body = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    status = body.get('value') or {}
+    status.setdefault('sessionId', body.get('sessionId'))
+    return status
+
+
+class _WDAUnavailableError(requests.ConnectionError):
+    """Raised without sending the request while the WDA server is considered down."""
+
+
+class _Retry(Retry):
+    """Retries with the backoff capped at 2 seconds, ``backoff_max`` needs urllib3 2."""
+
+    BACKOFF_CAP = 2
+
+    def get_backoff_time(self):
+        return min(super(_Retry, self).get_backoff_time(), self.BACKOFF_CAP)
+
+
+class _CircuitBreakerAdapter(HTTPAdapter):
+    """Connection pool of one WDA server that fails fast while the server is down.
+
+    Every request waits at most the `watchdog` for WDA. After `failure_threshold`
+    requests in a row fail with a transport error or a gateway status, the circuit
+    opens and requests raise `_WDAUnavailableError` for `reset_timeout`. The next
+    request then checks /status: if WDA answers, `on_recover` is called with the
+    status and may return the ids of a lost and a new session; the request is sent
+    to the new one.
+    """
+
+    def __init__(self, wda_url, config, on_recover, **kwargs):
+        super(_CircuitBreakerAdapter, self).__init__(**kwargs)
+        self.wda_url = wda_url
+        self.threshold = config['failure_threshold']
+        self.reset_timeout = config['reset_timeout']
+        self.health_timeout = config['connect_timeout']
+        self.watchdog = config['watchdog'] or config['read_timeout']
+        self.on_recover = on_recover
+        self.armed = False
+        self.failures = 0
+        self.opened = None
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        if self.armed:
+            self._wait_closed(request)
+        try:
+            response = super(_CircuitBreakerAdapter, self).send(request, stream=stream,
+                                                                timeout=self._bounded(timeout), **kwargs)
+        except requests.RequestException:
+            self._record(False)
+            raise
+        self._record(response.status_code not in (502, 503, 504))
+        return response
+
+    def reset(self, status):
+        """Closes the circuit after WDA answered with `status`, returning what `on_recover` returned."""
+        with self._lock:
+            self.opened = None
+            self.failures = 0
+        return self.on_recover(status)
+
+    def _bounded(self, timeout):
+        if timeout is None:
+            return self.watchdog
+        if isinstance(timeout, tuple):
+            return tuple(self.watchdog if value is None else min(value, self.watchdog) for value in timeout)
+        if isinstance(timeout, (int, float)):
+            return min(timeout, self.watchdog)
+        return timeout
+
+    def _record(self, succeeded):
+        with self._lock:
+            if succeeded:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.armed and self.opened is None and self.failures >= self.threshold:
+                self.opened = time.time()
+                self.trips += 1
+                logger.warn("WDA at '%s' failed %d requests in a row, failing fast for %s."
+                            % (self.wda_url, self.failures, secs_to_timestr(self.reset_timeout)))
+
+    def _wait_closed(self, request):
+        """Raises while the circuit is open; after `reset_timeout` checks WDA and closes it if healthy."""
+        with self._lock:
+            if self.opened is None:
+                return
+            remaining = self.opened + self.reset_timeout - time.time()
+            if remaining <= 0:
+                # one request checks the health, the others keep failing fast meanwhile
+                self.opened = time.time()
+        if remaining > 0:
+            raise _WDAUnavailableError("WDA at '%s' is down, failing fast for %s more"
+                                       % (self.wda_url, secs_to_timestr(remaining)), request=request)
+        status = _wda_status(self.wda_url, self.health_timeout)
+        if status is None:
+            raise _WDAUnavailableError("WDA at '%s' is down, /status did not answer" % self.wda_url, request=request)
+        sessions = self.reset(status)
+        if sessions is not None:
+            request.url = request.url.replace('/session/%s' % sessions[0], '/session/%s' % sessions[1])
+
+
+class _TransportStats(object):
+    """Collects latency and size of WDA responses per endpoint."""
+    _ids = re.compile(r'/(session|element)/[^/]+')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.on_record = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def record(self, response, *args, **kwargs):
+        endpoint = '%s %s' % (response.request.method,
+                              self._ids.sub(r'/\1/{id}', urlparse(response.request.url).path))
+        # hooks run before requests reads the body, so the download is timed here
+        start = time.time()
+        size = len(response.content)
+        transfer = time.time() - start
+        latency = response.elapsed.total_seconds() + transfer
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {'latencies': [], 'bytes': 0})
+            stats['latencies'].append(latency)
+            stats['bytes'] += size
+        if self.on_record is not None:
+            self.on_record(response.elapsed.total_seconds(), transfer, size)
+
+    def summary(self):
+        summary = {}
+        with self._lock:
+            for endpoint, stats in self._endpoints.items():
+                latencies = sorted(stats['latencies'])
+                summary[endpoint] = {
+                    'count': len(latencies),
+                    'bytes': stats['bytes'],
+                    'p50': self._percentile(latencies, 50),
+                    'p95': self._percentile(latencies, 95),
+                    'p99': self._percentile(latencies, 99)
+                }
+        return summary
+
+    @staticmethod
+    def _percentile(values, percent):
+        return values[max(0, int(round(percent / 100.0 * len(values))) - 1)]
+
+
+class _Profiler(object):
+    """Robot listener timing the keywords of the library, see `iOSWDALibrary.enable_profiler`.
+
+    Uses listener API version 2 because library listeners of version 3 get no
+    keyword events. Requests and sleeps are only counted for the thread that
+    runs the keyword.
+    """
+    ROBOT_LISTENER_API_VERSION = 2
+    _columns = ('calls', 'seconds', 'device', 'network', 'sleep', 'other', 'requests', 'bytes')
+
+    def __init__(self):
+        self.enabled = False
+        self.libnames = set()
+        self.locator_prefixes = frozenset()
+        self._calls = []
+        self._call = None
+        self._suites = []
+        self._test = None
+
+    def start_suite(self, name, attrs):
+        self._suites.append(attrs['longname'])
+
+    def end_suite(self, name, attrs):
+        self._suites.pop()
+
+    def start_test(self, name, attrs):
+        self._test = attrs['longname']
+
+    def end_test(self, name, attrs):
+        self._test = None
+
+    def start_keyword(self, name, attrs):
+        if self.enabled and self._call is None and attrs['libname'] in self.libnames:
+            self._call = {'keyword': attrs['kwname'], 'suite': self._suites[-1], 'test': self._test,
+                          'locator': self._locator(attrs['args']), 'device': 0.0, 'network': 0.0, 'sleep': 0.0, 'requests': 0, 'bytes': 0,
+                          'thread': threading.get_ident(), 'start': time.time()}
+
+    def end_keyword(self, name, attrs):
+        call = self._call
+        if call is None or attrs['kwname'] != call['keyword'] or attrs['libname'] not in self.libnames:
+            return
+        self._call = None
+        call['seconds'] = time.time() - call.pop('start')
+        call['other'] = max(0.0, call['seconds'] - call['device'] - call['network'] - call['sleep'])
+        del call['thread']
+        self._calls.append(call)
+
+    def _locator(self, args):
+        """Returns the first argument if it is a locator, not e.g. a named argument like ``timeout=5s``."""
+        if not args:
+            return None
+        argument = BuiltIn().replace_variables(args[0])
+        if not isinstance(argument, str) or '=' not in argument:
+            return None
+        if argument.startswith('locator='):
+            argument = argument[len('locator='):]
+        try:
+            (prefix, _) = _parse_locator(argument)
+        except IndexError:
+            return None
+        return argument if prefix in self.locator_prefixes else None
+
+    def record_request(self, device, network, size):
+        call = self._call
+        if call is not None and call['thread'] == threading.get_ident():
+            call['device'] += device
+            call['network'] += network
+            call['requests'] += 1
+            call['bytes'] += size
+
+    def sleep(self, seconds):
+        """`time.sleep` counted as sleep time of the running keyword."""
+        call = self._call
+        if call is not None and call['thread'] == threading.get_ident():
+            call['sleep'] += seconds
+        time.sleep(seconds)
+
+    def write_report(self, suite, suite_id, outdir):
+        """Writes the JSON and HTML reports of the calls made in `suite` and returns the HTML file name."""
+        calls = [call for call in self._calls if call['suite'] == suite or call['suite'].startswith(suite + '.')]
+        if '-' not in suite_id:
+            self._calls = []
+        if not calls:
+            return None
+        report = {'suite': suite,
+                  'keywords': self._group(calls, 'keyword'),
+                  'locators': self._group([call for call in calls if call['locator']], 'locator'),
+                  'tests': self._group([call for call in calls if call['test']], 'test')}
+        name = 'wda-profile-%s' % suite_id
+        with open(os.path.join(outdir, name + '.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(outdir, name + '.html'), 'w', encoding='utf-8') as f:
+            f.write(self._html(report))
+        return name + '.html'
+
+    def _group(self, calls, key):
+        groups = {}
+        for call in calls:
+            group = groups.setdefault(call[key], dict.fromkeys(self._columns, 0))
+            group['calls'] += 1
+            for column in self._columns[1:]:
+                group[column] += call[column]
+        rows = []
+        for value, group in groups.items():
+            row = {key: value}
+            row.update((column, round(total, 3)) for column, total in group.items())
+            rows.append(row)
+        # the slowest first
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def _html(self, report):
+        parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>WDA profile of %s</title>'
+                 '<style>body{font-family:sans-serif}table{border-collapse:collapse;margin-bottom:2em}'
+                 'td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}'
+                 'td:first-child,th:first-child{text-align:left}</style></head><body>'
+                 '<h1>WDA profile of %s</h1>' % (html.escape(report['suite']), html.escape(report['suite']))]
+        for key, title in (('keyword', 'Keywords'), ('locator', 'Locators'), ('test', 'Tests')):
+            rows = report[key + 's']
+            parts.append('<h2>%s</h2><table><tr>%s</tr>' % (
+                title, ''.join('<th>%s</th>' % column for column in (key,) + self._columns)))
+            for row in rows:
+                parts.append('<tr>%s</tr>' % ''.join('<td>%s</td>' % html.escape(str(row[column]))
+                                                     for column in (key,) + self._columns))
+            parts.append('</table>')
+        parts.append('</body></html>')
+        return '\n'.join(parts)
+
+
+class _PageSnapshot(object):
+    """Parsed copy of the WDA page source."""
+    _attributes = {
+        'id': 'name',
+        'name': 'name',
+        'label': 'label',
+        'text': 'label',
+        'value': 'value'
+    }
+
+    def __init__(self, source):
+        _ensure_recursion_limit()
+        self.created = time.time()
+        self.source = source
+        self._indexes = {}
+        etree = _lxml_etree()
+        if etree is not None:
+            self.root = etree.fromstring(source.encode('utf-8'), etree.XMLParser(huge_tree=True))
+        else:
+            # wrap the application node so that '//*' also matches the root like on WDA
+            self.root = ElementTree.Element('AppiumAUT')
+            self.root.append(ElementTree.fromstring(source.encode('utf-8')))
+
+    def age(self):
+        return time.time() - self.created
+
+    def window_size(self):
+        """Returns the (width, height) of the application frame in points."""
+        application = self.root[0] if self.root.tag == 'AppiumAUT' else self.root
+        return (float(application.get('width', 0)), float(application.get('height', 0)))
+
+    @classmethod
+    def supports(cls, prefix, criteria):
+        """Tells whether the locator can be evaluated on the page source, without fetching it."""
+        if prefix in cls._attributes or prefix in ('type', 'labelcontains'):
+            return True
+        if prefix == 'xpath':
+            return _compile_xpath(criteria) is not None
+        return False
+
+    def find(self, prefix, criteria):
+        """Returns the nodes matching the locator, or None if it can not be evaluated locally."""
+        if not self.supports(prefix, criteria):
+            return None
+        attribute = self._attributes.get(prefix)
+        if attribute is not None:
+            return self._indexed(attribute, criteria)
+        if prefix == 'type':
+            return self._indexed('type', 'XCUIElementType' + criteria)
+        if prefix == 'labelcontains':
+            return [node for node in self.root.iter() if criteria in (node.get('label') or '')]
+        nodes = _compile_xpath(criteria)(self.root)
+        if not isinstance(nodes, list):
+            return []
+        return [node for node in nodes if isinstance(getattr(node, 'tag', None), str)]
+
+    def _indexed(self, attribute, value):
+        """Returns the nodes whose `attribute` equals `value`, indexing the attribute on first use."""
+        index = self._indexes.get(attribute)
+        if index is None:
+            index = self._indexes[attribute] = {}
+            for node in self.root.iter():
+                index.setdefault(node.get(attribute), []).append(node)
+        return index.get(value, [])
+
+    def contains_text(self, text):
+        for _ in self.text_nodes(text):
+            return True
+        return False
+
+    def text_nodes(self, text):
+        """Yields the visible nodes whose label or value contains `text`."""
+        for node in self.root.iter():
+            if text in (node.get('label') or '') or text in (node.get('value') or ''):
+                if node.get('visible') == 'true':
+                    yield node
+
+    def fingerprint(self):
+        """Digest of the page source, equal for pages that did not change."""
+        return hashlib.sha1(self.source.encode('utf-8')).hexdigest()
+
+
+class _PageWatcher(object):
+    """Fetches the page source on every poll and tells whether it changed since the previous one.
+
+    The source is only parsed when a condition has to be evaluated on it.
+    """
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._source = None
+        self._digest = None
+        self._snapshot = None
+        self.changes = 0
+
+    def poll(self):
+        """Fetches the page source, returning True if it differs from the previous poll."""
+        source = self._fetch()
+        digest = hashlib.sha1(source.encode('utf-8')).digest()
+        if digest == self._digest:
+            return False
+        self._source = source
+        self._digest = digest
+        self._snapshot = None
+        self.changes += 1
+        return True
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = _PageSnapshot(self._source)
+        return self._snapshot
+
+    def watch(self, check):
+        """Returns a wait condition calling `check` with the page snapshot, only when the page changed."""
+        results = []
+
+        def condition():
+            if self.poll():
+                results[:] = [check(self.snapshot())]
+            return results[0]
+        return condition
+
+
+class _ElementHandle(object):
+    """Resolves a locator once and reuses the element id for every call made on it.
+
+    Properties and methods of `wda.Element` are proxied. If WDA reports the
+    element as stale, the locator is resolved again, once.
+    """
+
+    def __init__(self, selector, locator):
+        self._selector = selector
+        self._locator = locator
+        self._element = None
+        self._resolved = False
+
+    def _resolve(self):
+        if not self._resolved:
+            elements = self._selector.find_elements()
+            self._element = elements[0] if elements else None
+            self._resolved = True
+        return self._element
+
+    def _call(self, operation):
+        for attempt in range(2):
+            element = self._resolve()
+            if element is None:
+                raise WDAElementNotFoundError("element not found", self._locator)
+            try:
+                return operation(element)
+            except WDAStaleElementReferenceError:
+                if attempt:
+                    raise
+                self._resolved = False
+
+    @property
+    def exists(self):
+        return self._resolve() is not None
+
+    def get(self):
+        """Resolves the element now, raising `WDAElementNotFoundError` if it is missing."""
+        self._call(lambda element: element)
+        return self
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if isinstance(getattr(wda.Element, name), property):
+            return self._call(lambda element: getattr(element, name))
+        return lambda *args: self._call(lambda element: getattr(element, name)(*args))
+
+
+class _SnapshotElement(object):
+    """Stand-in for `wda.Element` backed by a page source node.
+
+    It can be read, and clicked through `session` at the center of its frame.
+    A missing element has no node.
+    """
+
+    def __init__(self, node, session=None, locator=None):
+        self._node = node
+        self._session = session
+        self._locator = locator
+
+    @property
+    def exists(self):
+        return self._node is not None
+
+    def get(self):
+        """Returns the element, raising `WDAElementNotFoundError` if it is missing."""
+        if self._node is None:
+            raise WDAElementNotFoundError("element not found", self._locator)
+        return self
+
+    def click(self):
+        center = self.get().bounds.center
+        self._session.click(center.x, center.y)
+
+    def _bool(self, key):
+        return self._node.get(key) == 'true'
+
+    @property
+    def label(self):
+        return self._node.get('label')
+
+    @property
+    def name(self):
+        return self._node.get('name')
+
+    @property
+    def value(self):
+        return self._node.get('value')
+
+    @property
+    def className(self):
+        return self._node.get('type')
+
+    @property
+    def visible(self):
+        return self._bool('visible')
+
+    @property
+    def displayed(self):
+        return self._bool('visible')
+
+    @property
+    def enabled(self):
+        return self._bool('enabled')
+
+    @property
+    def accessible(self):
+        return self._bool('accessible')
+
+    @property
+    def bounds(self):
+        x, y, w, h = [int(float(self._node.get(k, 0))) for k in ('x', 'y', 'width', 'height')]
+        return wda.Rect(x, y, w, h)
+
+
 if __name__ == "__main__":
     try:
         test_lib = iOSWDALibrary()
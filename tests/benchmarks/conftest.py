@@ -0,0 +1,93 @@
+"""Keyword benchmarks against the fake WDA server.
+
+Every benchmark records the median wall time of a keyword with
+pytest-benchmark, and the WDA requests and response bytes of one call in its
+``extra_info``. A benchmark fails when it makes more requests than in
+``baseline.json``, or receives more bytes or takes longer beyond the threshold.
+Bytes and times are only compared when run with the latency and page of the
+baseline, requests always. Times are only compared with ``--benchmark-only``,
+so that a plain ``pytest`` run does not depend on the speed of the machine.
+
+Knobs, as environment variables:
+ - WDA_BENCH_LATENCY - seconds added to every WDA response, default 0.02
+ - WDA_BENCH_NODES - number of cells in the page, default 200
+ - WDA_BENCH_SOURCE - page source file to serve instead, e.g. saved with `Get Source`
+ - WDA_BENCH_THRESHOLD - allowed growth of time and bytes, default 0.2 (20%)
+ - WDA_BENCH_TOLERANCE - seconds of time growth that never fail, default 0.02
+ - WDA_BENCH_SAVE - set to 1 to write the results as new baseline
+"""
+import json
+import os
+
+import pytest
+
+from fakewda import FakeWDA
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+LATENCY = float(os.environ.get('WDA_BENCH_LATENCY', 0.02))
+NODES = int(os.environ.get('WDA_BENCH_NODES', 200))
+SOURCE = os.environ.get('WDA_BENCH_SOURCE')
+THRESHOLD = float(os.environ.get('WDA_BENCH_THRESHOLD', 0.2))
+TOLERANCE = float(os.environ.get('WDA_BENCH_TOLERANCE', 0.02))
+ROUNDS = 5
+
+
+@pytest.fixture(scope='session')
+def baseline():
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    results = {}
+    yield baseline, results
+    if os.environ.get('WDA_BENCH_SAVE') == '1':
+        baseline.update({'latency': LATENCY, 'nodes': NODES, 'source': SOURCE})
+        baseline['results'].update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+@pytest.fixture
+def wda_server():
+    source = None
+    if SOURCE:
+        with open(SOURCE, encoding='utf-8') as f:
+            source = f.read()
+    with FakeWDA(nodes=NODES, latency=LATENCY, source=source) as server:
+        yield server
+
+
+@pytest.fixture
+def measure(benchmark, baseline, wda_server, request):
+    """Benchmarks `keyword` called with `args` and checks it against the baseline."""
+    (baseline, results) = baseline
+
+    def measure(keyword, *args):
+        calls = []
+
+        def call():
+            calls.append(None)
+            return keyword(*args)
+
+        wda_server.reset()
+        benchmark.pedantic(call, rounds=ROUNDS, iterations=1, warmup_rounds=1)
+        result = {'requests': round(len(wda_server.requests) / float(len(calls)), 2),
+                  'bytes': int(wda_server.received / len(calls))}
+        if not benchmark.disabled:
+            result['seconds'] = round(benchmark.stats.stats.median, 4)
+        benchmark.extra_info.update(result)
+        results[request.node.name] = result
+        expected = baseline['results'].get(request.node.name)
+        if expected is None or os.environ.get('WDA_BENCH_SAVE') == '1':
+            return result
+        regressions = []
+        if result['requests'] > expected['requests']:
+            regressions.append('%s requests instead of %s' % (result['requests'], expected['requests']))
+        same_setup = (baseline['latency'], baseline['nodes'], baseline.get('source')) == (LATENCY, NODES, SOURCE)
+        if same_setup and result['bytes'] > expected['bytes'] * (1 + THRESHOLD):
+            regressions.append('%d bytes instead of %d' % (result['bytes'], expected['bytes']))
+        timed = same_setup and 'seconds' in result and request.config.getoption('benchmark_only')
+        if timed and result['seconds'] > expected['seconds'] * (1 + THRESHOLD) + TOLERANCE:
+            regressions.append('%.4fs instead of %.4fs' % (result['seconds'], expected['seconds']))
+        assert not regressions, 'Regressed: ' + ', '.join(regressions)
+        return result
+    return measure
@@ -0,0 +1,25 @@
+"""Latency, WDA requests and bytes of the most used keywords."""
+
+
+def test_click_text(measure, library):
+    measure(library.click_text, 'Row 3')
+
+
+def test_wait_until_page_contains(measure, library):
+    measure(library.wait_until_page_contains, 'Row 3')
+
+
+def test_element_text_should_be(measure, library):
+    measure(library.element_text_should_be, 'name=row3', 'Row 3')
+
+
+def test_get_element_location(measure, library):
+    measure(library.get_element_location, 'name=row3')
+
+
+def test_drag_and_drop_by_element(measure, library):
+    measure(library.drag_and_drop_by_element, 'name=row1', 'name=row5')
+
+
+def test_capture_screenshot(measure, library, tmp_path):
+    measure(library.capture_screenshot, str(tmp_path / 'screen.png'))
@@ -0,0 +1,33 @@
+"""XPath evaluated by WDA against evaluated on the page source, see `Enable Local XPath`.
+
+The fake WDA answers xpath queries as fast as the page source; set
+WDA_BENCH_LATENCY to the time a device takes for them. WDA_BENCH_XPATH
+replaces the queried xpath, e.g. to match a page given in WDA_BENCH_SOURCE.
+"""
+import os
+
+import pytest
+
+from iOSWDALibrary import _PageSnapshot
+
+XPATHS = {'custom': os.environ['WDA_BENCH_XPATH']} if os.environ.get('WDA_BENCH_XPATH') else {
+    'visible cells': '//XCUIElementTypeCell[@visible="true"]',
+    'cell by text': '//XCUIElementTypeCell[.//XCUIElementTypeStaticText[@label="Row 3"]]'
+}
+
+
+@pytest.mark.parametrize('xpath', list(XPATHS.values()), ids=list(XPATHS))
+def test_xpath_on_device(measure, library, xpath):
+    measure(lambda: library._find_by_xpath(xpath).find_element_ids())
+
+
+@pytest.mark.parametrize('xpath', list(XPATHS.values()), ids=list(XPATHS))
+def test_xpath_on_page_source(measure, library, xpath):
+    measure(lambda: _PageSnapshot(library.get_source()).find('xpath', xpath))
+
+
+@pytest.mark.parametrize('xpath', list(XPATHS.values()), ids=list(XPATHS))
+def test_both_find_the_same_elements(library, xpath):
+    device = library._find_by_xpath(xpath).find_elements()
+    local = _PageSnapshot(library.get_source()).find('xpath', xpath)
+    assert [element.label for element in device] == [node.get('label') for node in local]
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakewda import FakeWDA  # noqa: E402
+from iOSWDALibrary import iOSWDALibrary  # noqa: E402
+
+
+@pytest.fixture
+def wda_server():
+    with FakeWDA() as server:
+        yield server
+
+
+@pytest.fixture
+def library(wda_server):
+    library = iOSWDALibrary()
+    library.open_application(wda_server.url, 'com.example.app')
+    wda_server.reset()
+    yield library
+    library.close_application()
@@ -0,0 +1,550 @@
+"""Fake WebDriverAgent server for the tests and benchmarks.
+
+`FakeWDA` answers the WDA requests sent by facebook-wda and by this library
+from a synthetic page: a ``Go`` button, a ``Hello`` text, a text field and a
+table of `nodes` cells named ``row<i>`` labeled ``Row <i>``, of which the ones
+inside the window are visible. `scroll_table` makes drags scroll the table.
+Locators (predicates, class chains, xpath and accessibility ids) are evaluated
+on that page.
+
+Every request is kept in `requests` as ``(method, path, body)`` and the size of
+the responses is summed in `received`, so that tests can count round trips.
+`latency` delays every response to simulate the tunnel to a real device. Taps
+are kept in `taps` and passed to `on_tap`, e.g. to switch the page, and
+gestures sent to /actions are kept in `actions` and passed to `on_actions`.
+Swipes and long presses take the duration they ask for. Screenshots are
+identical, unless `stamp_screenshots` is set to write the time they were taken
+into them, see `screenshot_time`.
+
+The server runs in threads with `start`, or in the running event loop with
+`start_async` for the asyncio client.
+"""
+import base64
+import fnmatch
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+WINDOW = (390, 844)
+SCALE = 3
+ROW_HEIGHT = 44
+TABLE_TOP = 150
+
+
+def make_source(nodes=40, texts=('Hello',), offset=0, web_texts=()):
+    """Returns the page source of an application with a table of `nodes` cells, scrolled by `offset` points.
+
+    Cells are visible where they show inside the table. With `web_texts` the
+    page also has a web view showing them.
+    """
+    width, height = WINDOW
+    app = _node('Application', 'App', 'App', 0, 0, width, height)
+    window = etree.SubElement(app, 'XCUIElementTypeWindow', _attributes('Window', None, None, 0, 0, width, height))
+    window.append(_node('Button', 'Go', 'Go', 10, 50, 60, 30))
+    for i, text in enumerate(texts):
+        window.append(_node('StaticText', 'text%d' % i, text, 10, 90 + 20 * i, 200, 20))
+    field = _node('TextField', 'field', None, 220, 50, 160, 30)
+    field.set('value', 'Search')
+    window.append(field)
+    if web_texts:
+        web_view = _node('WebView', None, None, 0, 600, width, 200)
+        for i, text in enumerate(web_texts):
+            web_view.append(_node('StaticText', None, text, 10, 610 + 30 * i, 200, 20))
+        window.append(web_view)
+    table = _node('Table', 'table', None, 0, TABLE_TOP, width, height - TABLE_TOP)
+    window.append(table)
+    for i in range(nodes):
+        y = TABLE_TOP + ROW_HEIGHT * i - offset
+        cell = _node('Cell', 'row%d' % i, 'Row %d' % i, 0, y, width, ROW_HEIGHT)
+        cell.append(_node('StaticText', None, 'Row %d' % i, 16, y + 12, 200, 20))
+        if y + ROW_HEIGHT <= TABLE_TOP:
+            for node in cell.iter():
+                node.set('visible', 'false')
+        table.append(cell)
+    return etree.tostring(app, encoding='unicode', xml_declaration=False)
+
+
+def _attributes(element_type, name, label, x, y, width, height):
+    attributes = {'type': 'XCUIElementType' + element_type, 'enabled': 'true',
+                  'visible': 'true' if y < WINDOW[1] and y + height > 0 else 'false', 'accessible': 'true',
+                  'x': str(x), 'y': str(y), 'width': str(width), 'height': str(height)}
+    if name is not None:
+        attributes['name'] = name
+    if label is not None:
+        attributes['label'] = label
+    return attributes
+
+
+def _node(element_type, name, label, x, y, width, height):
+    return etree.Element('XCUIElementType' + element_type,
+                         _attributes(element_type, name, label, x, y, width, height))
+
+
+class FakeWDA(object):
+
+    def __init__(self, nodes=40, latency=0.0, source=None):
+        self.latency = latency
+        self.requests = []
+        self.received = 0
+        self.taps = []
+        self.actions = []
+        self.on_tap = None
+        self.on_actions = None
+        self.stamp_screenshots = False
+        self.session_id = 'session-1'
+        self.nodes = nodes
+        self.offset = 0
+        self.url = None
+        self._sessions = 1
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._server = None
+        self._runner = None
+        self.set_source(source or make_source(nodes))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def set_source(self, source):
+        """Replaces the page, elements found before become stale."""
+        with self._lock:
+            self.source = source
+            self._root = etree.fromstring(source.encode('utf-8'))
+            self._aut = etree.Element('AppiumAUT')
+            self._aut.append(self._root)
+            self._nodes = list(self._root.iter())
+            self._ids = dict((node, i) for i, node in enumerate(self._nodes))
+            self._generation += 1
+
+    def scroll_table(self):
+        """Makes vertical drags sent to /actions scroll the table, until its end."""
+        visible_height = WINDOW[1] - TABLE_TOP
+        end = max(0, self.nodes * ROW_HEIGHT - visible_height)
+
+        def drag(body):
+            for action in body['actions']:
+                moves = [step['y'] for step in action['actions'] if step['type'] == 'pointerMove']
+                self.offset = min(max(self.offset + moves[0] - moves[-1], 0), end)
+            self.set_source(make_source(self.nodes, offset=self.offset))
+        self.on_actions = drag
+
+    def reset(self):
+        """Forgets the requests and taps seen so far."""
+        with self._lock:
+            self.requests = []
+            self.received = 0
+            self.taps = []
+            self.actions = []
+
+    def paths(self):
+        """Returns the paths requested so far, without query."""
+        return [path.split('?')[0] for (_, path, _) in self.requests]
+
+    def start(self):
+        """Serves in background threads and returns the url."""
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        self.url = 'http://127.0.0.1:%d' % self._server.server_address[1]
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    async def start_async(self):
+        """Serves in the running event loop with aiohttp and returns the url."""
+        import asyncio
+        from aiohttp import web
+
+        async def handle(request):
+            body = await request.read()
+            body = json.loads(body) if body else None
+            delay = self.latency + self.gesture_time(request.path, body)
+            if delay:
+                await asyncio.sleep(delay)
+            (status, payload) = self.answer(request.method, request.path_qs, body)
+            return web.Response(status=status, body=payload, content_type='application/json')
+
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = 'http://127.0.0.1:%d' % self._runner.addresses[0][1]
+        return self.url
+
+    async def stop_async(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @staticmethod
+    def gesture_time(path, body):
+        """Returns how long the device takes to perform a swipe or long press, 0 for other requests."""
+        if path.split('?')[0].endswith(('/wda/dragfromtoforduration', '/wda/touchAndHold')):
+            return float((body or {}).get('duration') or 0)
+        return 0
+
+    def answer(self, method, path, body):
+        """Returns the status and the JSON bytes WDA would answer with."""
+        with self._lock:
+            self.requests.append((method, path, body))
+            (status, value) = self._route(method, path.split('?')[0], body or {})
+            payload = json.dumps({'value': value, 'sessionId': self.session_id}).encode('utf-8')
+            self.received += len(payload)
+        return status, payload
+
+    # private
+    def _route(self, method, path, body):
+        match = re.match(r'/session/([^/]+)(/.*)?$', path)
+        if match:
+            if match.group(1) != self.session_id:
+                return _error('invalid session id', 'Session does not exist')
+            path = match.group(2) or '/'
+        elif path == '/session' and method == 'POST':
+            self._sessions += 1
+            self.session_id = 'session-%d' % self._sessions
+            return 200, {'sessionId': self.session_id, 'capabilities': {}}
+        if path == '/status':
+            return 200, {'ready': True, 'sessionId': self.session_id, 'state': 'success'}
+        if path == '/source':
+            return 200, '<?xml version="1.0" encoding="UTF-8"?>' + self.source
+        if path in ('/elements', '/element'):
+            nodes = self._find(body['using'], body['value'])
+            if path == '/element':
+                if not nodes:
+                    return _error('no such element', 'unable to find an element')
+                return 200, self._reference(nodes[0])
+            return 200, [self._reference(node) for node in nodes]
+        match = re.match(r'/element/([^/]+)/(.+)$', path)
+        if match:
+            return self._element(method, match.group(1), match.group(2), body)
+        if path == '/window/size':
+            return 200, {'width': WINDOW[0], 'height': WINDOW[1]}
+        if path == '/wda/screen':
+            return 200, {'scale': SCALE, 'statusBarSize': {'width': WINDOW[0], 'height': 47}}
+        if path == '/screenshot':
+            return 200, _screenshot(self.stamp_screenshots)
+        if path == '/orientation':
+            return 200, 'PORTRAIT'
+        if path in ('/wda/tap/0', '/wda/touchAndHold'):
+            self._tap(body['x'], body['y'])
+            return 200, None
+        if path in ('/actions', '/wda/touch/perform'):
+            self.actions.append(body)
+            for (x, y) in _action_taps(body):
+                self._tap(x, y)
+            if self.on_actions is not None:
+                self.on_actions(body)
+            return 200, None
+        if path == '/wda/locked':
+            return 200, False
+        if path == '/wda/activeAppInfo':
+            return 200, {'bundleId': 'com.example.app', 'name': '', 'pid': 1}
+        return 200, None
+
+    def _element(self, method, element_id, command, body):
+        node = self._node_by_id(element_id)
+        if node is None:
+            return _error('stale element reference', 'The element is not attached to the page')
+        if command == 'rect':
+            return 200, dict((key, int(float(node.get(key, 0)))) for key in ('x', 'y', 'width', 'height'))
+        if command.startswith('attribute/'):
+            name = command.split('/', 1)[1]
+            value = node.get(name)
+            if name in ('visible', 'enabled', 'accessible'):
+                return 200, value == 'true'
+            return 200, value
+        if command == 'text':
+            return 200, node.get('label') or node.get('value')
+        if command == 'displayed':
+            return 200, node.get('visible') == 'true'
+        if command == 'enabled':
+            return 200, node.get('enabled') == 'true'
+        if command == 'name':
+            return 200, node.get('type')
+        if command == 'click':
+            (x, y, width, height) = (float(node.get(key, 0)) for key in ('x', 'y', 'width', 'height'))
+            self._tap(x + width / 2, y + height / 2)
+            return 200, None
+        if command == 'value' and method == 'POST':
+            node.set('value', (node.get('value') or '') + ''.join(body.get('value') or [body.get('text', '')]))
+            return 200, None
+        if command == 'clear':
+            node.set('value', '')
+            return 200, None
+        return 200, None
+
+    def _tap(self, x, y):
+        self.taps.append((x, y))
+        if self.on_tap is not None:
+            self.on_tap(x, y)
+
+    def _reference(self, node):
+        element_id = '%d-%d' % (self._generation, self._ids[node])
+        return {'ELEMENT': element_id, 'element-6066-11e4-a52e-4f735466cecf': element_id}
+
+    def _node_by_id(self, element_id):
+        (generation, index) = element_id.split('-')
+        if int(generation) != self._generation:
+            return None
+        return self._nodes[int(index)]
+
+    def _find(self, using, value):
+        if using in ('id', 'accessibility id', 'name'):
+            return [node for node in self._nodes if node.get('name') == value]
+        if using == 'class name':
+            return [node for node in self._nodes if node.get('type') == value]
+        if using == 'predicate string':
+            predicate = _Predicate(value)
+            return [node for node in self._nodes if predicate(node)]
+        if using == 'class chain':
+            return _class_chain(self._root, value)
+        if using == 'xpath':
+            return [node for node in self._aut.xpath(value)
+                    if isinstance(getattr(node, 'tag', None), str) and node is not self._aut]
+        raise ValueError('Unsupported locator strategy %r' % using)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, do not wait for delayed acks in between
+    disable_nagle_algorithm = True
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._answer()
+
+    do_POST = do_DELETE = do_GET
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        body = json.loads(body) if body else None
+        delay = self.fake.latency + self.fake.gesture_time(self.path, body)
+        if delay:
+            time.sleep(delay)
+        (status, payload) = self.fake.answer(self.command, self.path, body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _error(error, message):
+    return 404, {'error': error, 'message': message}
+
+
+def _action_taps(body):
+    """Returns the points where a pointer of W3C or touch actions went down and up without moving."""
+    taps = []
+    for action in body.get('actions', []):
+        (position, down) = (None, None)
+        for step in action.get('actions', []):
+            if step.get('type') == 'pointerMove':
+                position = (step.get('x'), step.get('y'))
+            elif step.get('type') == 'pointerDown':
+                down = position
+            elif step.get('type') == 'pointerUp' and down is not None and down == position:
+                taps.append(position)
+    return taps
+
+
+_screenshots = {}
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def _screenshot(stamp):
+    """Returns a white PNG of the screen size, base64 encoded, with the time it was taken in a text chunk if `stamp`."""
+    if 'image' not in _screenshots:
+        (width, height) = (WINDOW[0] * SCALE, WINDOW[1] * SCALE)
+        rows = (b'\x00' + b'\xff' * 3 * width) * height
+        header = _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        _screenshots['image'] = b'\x89PNG\r\n\x1a\n' + header + _chunk(b'IDAT', zlib.compress(rows))
+    png = _screenshots['image']
+    if stamp:
+        png += _chunk(b'tEXt', b'taken\x00%.6f' % time.time())
+    png += _chunk(b'IEND', b'')
+    return base64.b64encode(png).decode('ascii')
+
+
+def screenshot_time(png):
+    """Returns when the fake took the screenshot `png`."""
+    return float(re.search(br'tEXttaken\x00([\d.]+)', png).group(1))
+
+
+def _class_chain(application, query):
+    """Evaluates a class chain query like ``**/XCUIElementTypeCell[`name == "row1"`]`` from the application."""
+    context = [application]
+    descendants = False
+    for step in _split_chain(query):
+        if step == '**':
+            descendants = True
+            continue
+        match = re.match(r'(\w+)', step)
+        element_type = match.group(1)
+        filters = re.findall(r'\[(`(?:[^`])*`|-?\d+)\]', step[match.end():])
+        found = []
+        for parent in context:
+            nodes = [node for node in (parent.iter() if descendants else parent) if node is not parent]
+            nodes = [node for node in nodes if element_type == 'XCUIElementTypeAny' or node.tag == element_type]
+            for condition in filters:
+                if condition.startswith('`'):
+                    predicate = _Predicate(condition[1:-1])
+                    nodes = [node for node in nodes if predicate(node)]
+                else:
+                    index = int(condition)
+                    index = index - 1 if index > 0 else index
+                    nodes = nodes[index:index + 1 or None] if -len(nodes) <= index < len(nodes) else []
+            found.extend(node for node in nodes if node not in found)
+        context = found
+        descendants = False
+    return context
+
+
+def _split_chain(query):
+    steps, step, quoted = [], '', False
+    for char in query:
+        if char == '`':
+            quoted = not quoted
+        if char == '/' and not quoted:
+            steps.append(step)
+            step = ''
+        else:
+            step += char
+    return [s for s in steps + [step] if s]
+
+
+class _Predicate(object):
+    """Evaluates the NSPredicate subset used by facebook-wda and this library on page source nodes."""
+    _token = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|(==|!=|<=|>=|=|<|>|\(|\))'
+                        r'|([A-Za-z_][\w.]*(?:\[[a-z]+\])?)|(-?\d+(?:\.\d+)?))')
+    _literals = {'TRUE': True, 'YES': True, 'FALSE': False, 'NO': False}
+
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        text = text.strip()
+        while position < len(text):
+            match = self._token.match(text, position)
+            if match is None or match.end() == position:
+                raise ValueError('Invalid predicate %r at %d' % (text, position))
+            (string, symbol, word, number) = match.groups()
+            if string is not None:
+                self.tokens.append(('literal', re.sub(r'\\(.)', r'\1', string[1:-1])))
+            elif number is not None:
+                self.tokens.append(('literal', float(number)))
+            elif word is not None and word.upper() in self._literals:
+                self.tokens.append(('literal', self._literals[word.upper()]))
+            else:
+                self.tokens.append(('word', symbol or word))
+            position = match.end()
+        self.position = 0
+        self.matches = self._or()
+
+    def __call__(self, node):
+        return self.matches(node)
+
+    def _peek(self):
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _keyword(self, *words):
+        word = self._peek()
+        if isinstance(word, str) and word.upper() in words:
+            self.position += 1
+            return True
+        return False
+
+    def _or(self):
+        terms = [self._and()]
+        while self._keyword('OR', '||'):
+            terms.append(self._and())
+        return lambda node: any(term(node) for term in terms)
+
+    def _and(self):
+        terms = [self._not()]
+        while self._keyword('AND', '&&'):
+            terms.append(self._not())
+        return lambda node: all(term(node) for term in terms)
+
+    def _not(self):
+        if self._keyword('NOT', '!'):
+            term = self._not()
+            return lambda node: not term(node)
+        if self._peek() == '(':
+            self._next()
+            term = self._or()
+            self._next()
+            return term
+        return self._comparison()
+
+    def _comparison(self):
+        attribute = self._next()[1]
+        attribute = re.sub(r'^wd(?=[A-Z])', '', attribute)
+        attribute = attribute[0].lower() + attribute[1:]
+        (operator, modifier) = re.match(r'(\w+|\W+)(?:\[(\w+)\])?$', self._next()[1].upper()).groups()
+        expected = self._next()[1]
+        fold = modifier is not None and 'C' in modifier
+
+        def compare(node):
+            actual = node.get(attribute)
+            if isinstance(expected, (bool, float)):
+                if actual in ('true', 'false'):
+                    actual = actual == 'true'
+                try:
+                    actual = float(actual)
+                except (TypeError, ValueError):
+                    return operator == '!='
+                return {'==': actual == expected, '=': actual == expected, '!=': actual != expected,
+                        '<': actual < expected, '>': actual > expected,
+                        '<=': actual <= expected, '>=': actual >= expected}[operator]
+            if actual is None:
+                return operator == '!='
+            (left, right) = (actual.lower(), expected.lower()) if fold else (actual, expected)
+            if operator in ('==', '='):
+                return left == right
+            if operator == '!=':
+                return left != right
+            if operator == 'CONTAINS':
+                return right in left
+            if operator == 'BEGINSWITH':
+                return left.startswith(right)
+            if operator == 'ENDSWITH':
+                return left.endswith(right)
+            if operator == 'LIKE':
+                return fnmatch.fnmatchcase(left, right)
+            if operator == 'MATCHES':
+                return re.fullmatch(right, left) is not None
+            raise ValueError('Unsupported predicate operator %r' % operator)
+        return compare
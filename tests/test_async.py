@@ -0,0 +1,120 @@
+"""AsyncIOSWDALibrary against many fake devices served from one event loop."""
+import asyncio
+import time
+
+import aiohttp
+import pytest
+import wda
+from wda.exceptions import WDAElementNotFoundError
+
+from fakewda import FakeWDA
+from iOSWDALibrary import AsyncIOSWDALibrary
+
+DEVICES = 60
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def with_devices(test, count=DEVICES, latency=0.0):
+    servers = [FakeWDA(nodes=20, latency=latency) for _ in range(count)]
+    urls = [await server.start_async() for server in servers]
+    try:
+        async with aiohttp.ClientSession() as http:
+            phones = [AsyncIOSWDALibrary(url, http) for url in urls]
+            await asyncio.gather(*[phone.open_application('com.example.app') for phone in phones])
+            return await test(servers, phones)
+    finally:
+        for server in servers:
+            await server.stop_async()
+
+
+def test_keywords_run_concurrently_on_all_devices():
+    async def test(servers, phones):
+        for server in servers:
+            server.reset()
+        await asyncio.gather(*[phone.click_text('Go') for phone in phones])
+        await asyncio.gather(*[phone.page_should_contain_text('Row 3') for phone in phones])
+        await asyncio.gather(*[phone.page_should_contain_element('type=Table >> name=row3') for phone in phones])
+        await asyncio.gather(*[phone.wait_until_page_contains('Hello', timeout='2s') for phone in phones])
+        texts = await asyncio.gather(*[phone.get_text('name=row5') for phone in phones])
+        sizes = await asyncio.gather(*[phone.window_size() for phone in phones])
+        screenshots = await asyncio.gather(*[phone.screenshot() for phone in phones])
+        return servers, texts, sizes, screenshots
+
+    (servers, texts, sizes, screenshots) = run(with_devices(test))
+    assert texts == ['Row 5'] * DEVICES
+    assert sizes == [(390, 844)] * DEVICES
+    assert all(png.startswith(b'\x89PNG') for png in screenshots)
+    for server in servers:
+        assert server.taps == [(40, 65)]
+        # find + rect + tap, then one request per lookup
+        assert len(server.requests) == 3 + 1 + 1 + 1 + 1 + 1 + 1
+
+
+def test_devices_wait_for_each_other_only_once():
+    latency = 0.05
+
+    async def test(servers, phones):
+        start = time.perf_counter()
+        await asyncio.gather(*[phone.page_should_contain_text('Hello') for phone in phones])
+        return time.perf_counter() - start
+
+    elapsed = run(with_devices(test, latency=latency))
+    assert elapsed < DEVICES * latency / 4
+
+
+def test_wait_until_times_out_with_the_keyword_error():
+    async def test(servers, phones):
+        with pytest.raises(AssertionError, match="Text 'Nope' did not appear in 200 milliseconds"):
+            await phones[0].wait_until_page_contains('Nope', timeout='200ms')
+        return len(servers[0].requests)
+
+    assert run(with_devices(test, count=1)) > 2
+
+
+def test_wda_errors_raise_facebook_wda_exceptions():
+    async def test(servers, phones):
+        with pytest.raises(WDAElementNotFoundError):
+            await phones[0].click_element('name=nope')
+        ids = await phones[0].find_elements('name=row1')
+        servers[0].set_source(servers[0].source)
+        with pytest.raises(wda.WDAStaleElementReferenceError):
+            await phones[0]._click_element_id(ids[0])
+        phones[0].session_id = 'gone'
+        with pytest.raises(wda.WDAInvalidSessionIdError):
+            await phones[0].window_size()
+
+    run(with_devices(test, count=1))
+
+
+LOCATORS = ['name=row3', 'type=Cell', 'xpath=//*[@name="row3"]', 'classChain=**/XCUIElementTypeCell',
+            'type=Table >> name=row3']
+
+
+def test_presence_checks_send_the_same_queries_as_the_keywords(library, wda_server):
+    for locator in LOCATORS:
+        library.page_should_contain_element(locator)
+    library.page_should_contain_text('Row 3')
+    keywords = [body for (_, path, body) in wda_server.requests]
+
+    async def test(servers, phones):
+        servers[0].reset()
+        for locator in LOCATORS:
+            await phones[0].page_should_contain_element(locator)
+        await phones[0].page_should_contain_text('Row 3')
+        return [body for (_, path, body) in servers[0].requests]
+
+    assert run(with_devices(test, count=1)) == keywords
+
+
+def test_get_text_of_an_xpath_asks_wda():
+    async def test(servers, phones):
+        servers[0].reset()
+        text = await phones[0].get_text('xpath=//*[@name="row5"]')
+        return text, servers[0].paths()
+
+    (text, paths) = run(with_devices(test, count=1))
+    assert text == 'Row 5'
+    assert '/source' not in paths
@@ -0,0 +1,57 @@
+"""Leasing devices of a pool shared through a file."""
+import json
+import threading
+
+import pytest
+
+from fakewda import FakeWDA
+from iOSWDALibrary import iOSWDALibrary
+
+
+@pytest.fixture
+def devices():
+    servers = [FakeWDA(), FakeWDA()]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def owners(pool_file):
+    with open(pool_file) as f:
+        return dict((url, device['owner']) for url, device in json.load(f).items())
+
+
+def test_leasing_again_releases_the_leased_device(devices, tmp_path):
+    pool_file = str(tmp_path / 'devices.json')
+    library = iOSWDALibrary()
+    library.register_devices(*[server.url for server in devices], pool_file=pool_file)
+    first = library.lease_device('com.example.app')
+    second = library.lease_device('com.example.app')
+    assert first == second
+    assert [owner is not None for owner in owners(pool_file).values()].count(True) == 1
+    library.release_device()
+    assert set(owners(pool_file).values()) == {None}
+
+
+def test_threads_lease_different_devices_with_own_instances(devices, tmp_path):
+    pool_file = str(tmp_path / 'devices.json')
+    leased = []
+    ready = threading.Barrier(len(devices))
+
+    def run():
+        library = iOSWDALibrary()
+        library.register_devices(*[server.url for server in devices], pool_file=pool_file)
+        leased.append(library.lease_device('com.example.app', timeout='5s'))
+        ready.wait()
+        library.page_should_contain_text('Hello')
+        library.release_device()
+
+    threads = [threading.Thread(target=run) for _ in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(leased) == sorted(server.url for server in devices)
+    assert set(owners(pool_file).values()) == {None}
@@ -0,0 +1,55 @@
+"""Get Elements Data and the keywords checking all the elements matching a locator."""
+import pytest
+
+
+def test_elements_data_comes_from_one_page_source(library, wda_server):
+    rows = library.get_elements_data('type=Cell')
+    assert wda_server.paths() == ['/source']
+    assert len(rows) == 40
+    assert rows[3] == {'label': 'Row 3', 'value': None, 'name': 'row3', 'type': 'XCUIElementTypeCell',
+                       'rect': {'x': 0, 'y': 282, 'width': 390, 'height': 44}, 'visible': True, 'enabled': True}
+    assert not rows[39]['visible']
+
+
+def test_elements_data_of_device_locators_matches_the_page_source(library, wda_server):
+    rows = library.get_elements_data('predicate=name BEGINSWITH "row3"')
+    assert '/source' not in wda_server.paths()
+    local = library.get_elements_data('labelContains=Row 3')[::2]
+    assert [row['label'] for row in rows] == ['Row 3'] + ['Row %d' % i for i in range(30, 40)]
+    for (row, expected) in zip(rows, local):
+        assert (row['label'], row['rect'], row['visible']) == (expected['label'], expected['rect'], expected['visible'])
+
+
+def test_element_count_should_be(library):
+    library.element_count_should_be('type=Cell', 40)
+    library.element_count_should_be('name=nope', '0')
+    with pytest.raises(AssertionError, match="Locator 'type=Button' should have matched 2 elements but it matched 1."):
+        library.element_count_should_be('type=Button', 2)
+
+
+def test_elements_texts_should_be(library, wda_server):
+    library.elements_texts_should_be('labelContains=Row 3', *[text for i in [3] + list(range(30, 40))
+                                                              for text in ['Row %d' % i] * 2])
+    assert wda_server.paths() == ['/source']
+
+
+def test_elements_texts_should_be_reports_every_mismatch(library):
+    with pytest.raises(AssertionError) as error:
+        library.elements_texts_should_be('type=Cell', 'Row 0', 'Row 9', 'Row 2', 'Row 7')
+    assert str(error.value) == ("Locator 'type=Cell': 4 elements should have matched but 40 did; "
+                                "element 1 text should have been 'Row 9' but it was 'Row 1'; "
+                                "element 3 text should have been 'Row 7' but it was 'Row 3'.")
+
+
+def test_every_element_attribute_should_be(library, wda_server):
+    library.every_element_attribute_should_be('type=Cell', 'enabled', 'true')
+    assert wda_server.paths() == ['/source']
+    with pytest.raises(AssertionError, match=r"element 17 visible was 'False'.*element 39 visible was 'False'"):
+        library.every_element_attribute_should_be('type=Cell', 'visible', True)
+
+
+def test_every_element_attribute_should_be_fails_without_elements(library):
+    with pytest.raises(AssertionError, match="Locator 'name=nope' did not match any element."):
+        library.every_element_attribute_should_be('name=nope', 'enabled', True)
+    with pytest.raises(ValueError, match="Attribute 'rect' is not one of enabled, label, name, type, value, visible"):
+        library.every_element_attribute_should_be('type=Cell', 'rect', 0)
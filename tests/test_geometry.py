@@ -0,0 +1,58 @@
+"""Device geometry read once per session and coordinates relative to the window."""
+import pytest
+
+from fakewda import SCALE, WINDOW
+
+
+def reads(server):
+    return sum(path.endswith('/window/size') for path in server.paths())
+
+
+def test_geometry_is_read_once(library, wda_server):
+    assert library.get_window_width() == WINDOW[0]
+    assert library.get_window_height() == WINDOW[1]
+    library.click_a_point('50%', '50%')
+    library.swipe('50%', '80%', '50%', '20%', 100)
+    assert library.get_device_geometry() == {'width': WINDOW[0], 'height': WINDOW[1], 'scale': SCALE,
+                                             'pixel_width': WINDOW[0] * SCALE, 'pixel_height': WINDOW[1] * SCALE,
+                                             'orientation': 'PORTRAIT'}
+    assert reads(wda_server) == 1
+    assert sum(path.endswith('/wda/screen') for path in wda_server.paths()) == 1
+
+
+def test_relative_coordinates_are_converted_to_points(library, wda_server):
+    library.click_a_point('50%', '25%')
+    library.click_a_point('300px', '600px')
+    assert wda_server.taps == [(WINDOW[0] // 2, WINDOW[1] // 4), (300 // SCALE, 600 // SCALE)]
+
+
+def test_absolute_coordinates_do_not_read_the_geometry(library, wda_server):
+    library.click_a_point(10, 20)
+    library.swipe(100, 600, 100, 200, 100)
+    assert reads(wda_server) == 0
+
+
+def test_geometry_is_read_again_after_rotating_the_device(library, wda_server):
+    library.get_window_width()
+    library.set_device_orientation('landscape')
+    library.get_window_width()
+    assert reads(wda_server) == 2
+
+
+def test_geometry_is_read_again_when_the_page_source_is_rotated(library, wda_server):
+    library.enable_page_snapshot()
+    library.get_window_width()
+    wda_server.set_source('<XCUIElementTypeApplication type="XCUIElementTypeApplication" name="App" label="App" '
+                          'x="0" y="0" width="%d" height="%d"/>' % (WINDOW[1], WINDOW[0]))
+    with pytest.raises(AssertionError):
+        library.page_should_contain_text('Hello')
+    library.get_window_width()
+    assert reads(wda_server) == 2
+
+
+def test_scrolling_uses_the_cached_geometry(library, wda_server):
+    wda_server.scroll_table()
+    library.get_window_width()
+    library.scroll_until_element_visible('name=row30')
+    assert len(wda_server.actions) == 2
+    assert reads(wda_server) == 1
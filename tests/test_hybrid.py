@@ -0,0 +1,58 @@
+"""Hybrid mode searching the web views of the screen first."""
+import time
+
+import pytest
+
+from fakewda import make_source
+
+WEB_VIEW = '**/XCUIElementTypeWebView'
+
+
+def queries(server):
+    """Returns the (using, value) of the element lookups sent so far."""
+    return [(body['using'], body['value']) for (_, path, body) in server.requests if path.endswith('/elements')]
+
+
+@pytest.fixture
+def hybrid(library, wda_server):
+    wda_server.set_source(make_source(web_texts=('Accept', 'Decline')))
+    library.enable_hybrid_mode(detect_ttl='300ms')
+    return library
+
+
+def test_click_text_is_searched_in_the_web_view(hybrid, wda_server):
+    hybrid.click_text('Accept')
+    assert queries(wda_server) == [
+        ('class chain', WEB_VIEW),
+        ('class chain', WEB_VIEW + '/**/XCUIElementTypeAny[`label CONTAINS "Accept" OR value CONTAINS "Accept"`]')]
+    assert wda_server.taps == [(110, 620)]
+
+
+def test_texts_outside_the_web_view_take_the_usual_path(hybrid, wda_server):
+    hybrid.page_should_contain_text('Decline')
+    hybrid.page_should_contain_text('Hello')
+    assert [using for (using, _) in queries(wda_server)] == ['class chain'] * 3 + ['predicate string']
+    assert queries(wda_server)[2][1].startswith(WEB_VIEW + '/**/')
+
+
+def test_web_view_detection_is_remembered_for_the_ttl(hybrid, wda_server):
+    hybrid.page_should_contain_text('Accept')
+    hybrid.page_should_contain_element('label=Decline')
+    assert queries(wda_server).count(('class chain', WEB_VIEW)) == 1
+    time.sleep(0.35)
+    hybrid.page_should_contain_text('Accept')
+    assert queries(wda_server).count(('class chain', WEB_VIEW)) == 2
+
+
+def test_screens_without_web_view_take_the_usual_path(library, wda_server):
+    library.enable_hybrid_mode()
+    library.page_should_contain_text('Hello')
+    library.page_should_contain_text('Row 3')
+    assert [using for (using, _) in queries(wda_server)] == ['class chain'] + ['predicate string'] * 2
+
+
+def test_web_views_are_not_searched_after_disabling_hybrid_mode(hybrid, wda_server):
+    hybrid.disable_hybrid_mode()
+    hybrid.click_text('Accept')
+    assert [using for (using, _) in queries(wda_server)] == ['predicate string']
+    assert wda_server.taps == [(110, 620)]
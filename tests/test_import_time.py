@@ -0,0 +1,33 @@
+"""Time it takes to import the library on top of Robot Framework.
+
+Dry-runs and libdoc pay this time before any keyword runs, heavy dependencies
+such as OpenCV are only imported by the keywords that need them.
+"""
+import os
+import subprocess
+import sys
+
+import iOSWDALibrary
+
+BUDGET = 0.25
+ROUNDS = 3
+
+
+def _import_time():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (os.path.dirname(iOSWDALibrary.__file__),
+                                                      env.get('PYTHONPATH'))))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import robot.api, iOSWDALibrary'],
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True)
+    # lines read 'import time: <self us> | <cumulative us> | <module>'
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == 'iOSWDALibrary':
+            return int(fields[1]) / 1e6
+    raise AssertionError('No import time reported for iOSWDALibrary:\n' + process.stderr)
+
+
+def test_import_time_is_within_budget():
+    seconds = min(_import_time() for _ in range(ROUNDS))
+    assert seconds <= BUDGET, 'Importing iOSWDALibrary takes %.3fs, more than %.3fs' % (seconds, BUDGET)
@@ -0,0 +1,34 @@
+"""Parsing of locators and chains."""
+import pytest
+
+from iOSWDALibrary import _class_chain, _parse_locator
+
+
+@pytest.mark.parametrize('locator, expected', [
+    ('name=Go', ('name', 'Go')),
+    ('Label = Row 1', ('label', 'Row 1')),
+    ('xpath=//*[@label="a >> b"]', ('xpath', '//*[@label="a >> b"]')),
+    ("predicate=label == 'a >> name=b'", ('predicate', "label == 'a >> name=b'")),
+    ('predicate=label == "say \\"a >> name=b\\""', ('predicate', 'label == "say \\"a >> name=b\\""')),
+    ('label=a >> b', ('label', 'a >> b')),
+])
+def test_text_of_a_locator_is_not_split(locator, expected):
+    assert _parse_locator(locator) == expected
+
+
+def test_chain_is_split_into_steps():
+    assert _parse_locator('type=Table >> id=row1 >> index=-1 >> labelContains=a >> b') == (
+        'chain', (('type', 'Table'), ('id', 'row1'), ('index', '-1'), ('labelcontains', 'a >> b')))
+    assert _parse_locator("label=Don't >> predicate=name == 'x >> y' >> name=z") == (
+        'chain', (('label', "Don't"), ('predicate', "name == 'x >> y'"), ('name', 'z')))
+
+
+def test_chain_steps_become_one_class_chain():
+    (_, steps) = _parse_locator('type=Table >> id=row1 >> index=0')
+    assert _class_chain(steps) == '**/XCUIElementTypeTable/**/XCUIElementTypeAny[`name == "row1"`][1]'
+
+
+def test_xpath_can_not_be_chained():
+    (_, steps) = _parse_locator('type=Table >> xpath=//*')
+    with pytest.raises(ValueError):
+        _class_chain(steps)
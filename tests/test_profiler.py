@@ -0,0 +1,51 @@
+"""Keyword profile and statistics written by the library listener in a Robot Framework run."""
+import io
+import json
+import os
+
+import robot
+
+SUITE = """*** Settings ***
+Library    iOSWDALibrary
+
+*** Test Cases ***
+Profiled
+    Open Application    ${URL}    com.example.app
+    Enable Profiler
+    Page Should Contain Element    name=Go
+    Click Element    locator=label=Go
+    Wait Until Page Is Stable    stable_time=200ms
+    Start Screen Recording    fps=4
+    Stop Screen Recording
+    Disable Profiler
+    Close Application
+"""
+
+
+def run(wda_server, tmp_path, suite):
+    return robot.run(str(suite), outputdir=str(tmp_path), output='NONE', log='NONE', report='NONE',
+                     variable=['URL:' + wda_server.url], pythonpath=[os.path.dirname(os.path.dirname(__file__))],
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+
+def test_profile_lists_only_locators(wda_server, tmp_path):
+    suite = tmp_path / 'profiled.robot'
+    suite.write_text(SUITE)
+    assert run(wda_server, tmp_path, suite) == 0
+    with open(str(tmp_path / 'wda-profile-s1.json')) as f:
+        profile = json.load(f)
+    assert sorted(row['locator'] for row in profile['locators']) == ['label=Go', 'name=Go']
+    assert len(profile['keywords']) == 6
+
+
+def test_every_suite_writes_its_own_statistics(wda_server, tmp_path):
+    suites = tmp_path / 'suites'
+    suites.mkdir()
+    for name in ('first', 'second'):
+        (suites / (name + '.robot')).write_text(SUITE)
+    assert run(wda_server, tmp_path, suites) == 0
+    for suite_id in ('s1-s1', 's1-s2'):
+        with open(str(tmp_path / ('wda-startup-times-%s.json' % suite_id))) as f:
+            assert json.load(f)[0]['bundle_id'] == 'com.example.app'
+        with open(str(tmp_path / ('wda-transport-stats-%s.json' % suite_id))) as f:
+            assert json.load(f)
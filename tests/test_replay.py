@@ -0,0 +1,64 @@
+"""WDA traffic recorded with Start WDA Recording and served by WDAReplayServer."""
+import time
+
+import pytest
+import wda
+
+from fakewda import make_source
+from iOSWDALibrary import WDAReplayServer, iOSWDALibrary
+
+
+def scenario(library, url):
+    library.open_application(url, 'com.example.app')
+    library.page_should_contain_text('Hello')
+    before = library.get_source()
+    library.click_element('name=Go')
+    after = library.get_source()
+    return before, after, library.get_text('name=row3')
+
+
+@pytest.fixture
+def archive(wda_server, tmp_path):
+    """Records `scenario` against the fake WDA, a click changes the page."""
+    wda_server.on_tap = lambda x, y: wda_server.set_source(make_source(texts=('Done',)))
+    library = iOSWDALibrary()
+    library.start_wda_recording()
+    recorded = scenario(library, wda_server.url)
+    path = library.stop_wda_recording(str(tmp_path / 'app.wda.gz'))
+    return path, recorded
+
+
+def test_replay_answers_like_the_recorded_device(archive):
+    (path, recorded) = archive
+    # the page source request is answered in the recorded order
+    assert 'Hello' in recorded[0] and 'Done' in recorded[1]
+    library = iOSWDALibrary()
+    url = library.start_wda_replay_server(path)
+    try:
+        assert scenario(library, url) == recorded
+        assert library._replay_server.unmatched == []
+    finally:
+        library.stop_wda_replay_server()
+
+
+def test_request_not_recorded_gets_a_wda_error(archive):
+    (path, _) = archive
+    library = iOSWDALibrary()
+    server = WDAReplayServer(path)
+    with server as url:
+        library.open_application(url, 'com.example.app')
+        with pytest.raises(wda.WDARequestError, match='Not recorded'):
+            library.get_text('name=nope')
+    assert [key.split(' ', 2)[:2] for key in server.unmatched] == [
+        ['POST', '/session/%s/elements' % library.session.session_id]]
+    assert 'nope' in server.unmatched[0]
+
+
+def test_replay_latency_delays_every_response(archive):
+    (path, _) = archive
+    library = iOSWDALibrary()
+    with WDAReplayServer(path, latency='100ms') as url:
+        library.open_application(url, 'com.example.app')
+        start = time.time()
+        library.page_should_contain_text('Hello')
+        assert time.time() - start >= 0.1
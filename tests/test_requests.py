@@ -0,0 +1,132 @@
+"""Number of WDA requests sent by the lookup keywords."""
+import pytest
+
+
+def requests_sent(server, keyword, *args):
+    server.reset()
+    keyword(*args)
+    return server.paths()
+
+
+@pytest.mark.parametrize('text', ['Hello', 'Row 3'])
+def test_page_should_contain_text_sends_one_request(library, wda_server, text):
+    paths = requests_sent(wda_server, library.page_should_contain_text, text)
+    assert [path.rsplit('/', 1)[1] for path in paths] == ['elements']
+
+
+def test_page_should_contain_text_asks_wda_for_visible_elements(library, wda_server):
+    requests_sent(wda_server, library.page_should_contain_text, 'Row 3')
+    assert wda_server.requests[0][2]['value'].endswith('AND visible == 1')
+    wda_server.reset()
+    with pytest.raises(AssertionError):
+        # the row is below the window
+        library.page_should_contain_text('Row 39')
+    assert len(wda_server.requests) == 1
+
+
+@pytest.mark.parametrize('locator', ['name=row3', 'label=Row 3', 'id=Go', 'type=Cell', 'labelContains=Row',
+                                     'predicate=name BEGINSWITH "row"'])
+def test_page_should_contain_element_sends_one_request(library, wda_server, locator):
+    paths = requests_sent(wda_server, library.page_should_contain_element, locator)
+    assert len(paths) == 1
+    assert wda_server.requests[0][2]['using'] == 'predicate string'
+    assert wda_server.requests[0][2]['value'].endswith(') AND visible == 1')
+
+
+def test_page_should_contain_element_ignores_hidden_matches_in_one_request(library, wda_server):
+    wda_server.reset()
+    with pytest.raises(AssertionError):
+        library.page_should_contain_element('name=row39')
+    assert len(wda_server.requests) == 1
+
+
+def test_xpath_is_checked_by_wda_in_one_request(library, wda_server):
+    paths = requests_sent(wda_server, library.page_should_contain_element, 'xpath=//*[@name="row3"]')
+    assert [path.rsplit('/', 1)[1] for path in paths] == ['elements']
+    assert wda_server.requests[0][2] == {'using': 'xpath', 'value': '(//*[@name="row3"])[@visible="true"]'}
+    wda_server.reset()
+    with pytest.raises(AssertionError):
+        library.page_should_contain_element('xpath=//*[@name="row39"]')
+    assert len(wda_server.requests) == 1
+
+
+def test_local_xpath_is_evaluated_on_one_page_source(library, wda_server):
+    library.enable_local_xpath()
+    paths = requests_sent(wda_server, library.page_should_contain_element, 'xpath=//*[@name="row3"]')
+    assert paths == ['/source']
+    wda_server.reset()
+    with pytest.raises(AssertionError):
+        library.page_should_contain_element('xpath=//*[@name="row39"]')
+    assert wda_server.paths() == ['/source']
+
+
+@pytest.mark.parametrize('locator', ['classChain=**/XCUIElementTypeCell', 'type=Table >> type=Cell'])
+def test_class_chains_are_checked_in_one_request(library, wda_server, locator):
+    paths = requests_sent(wda_server, library.page_should_contain_element, locator)
+    assert len(paths) == 1
+    assert wda_server.requests[0][2]['value'].endswith('[`visible == 1`]')
+    wda_server.reset()
+    with pytest.raises(AssertionError):
+        library.page_should_contain_element(locator + '[-1]' if locator.startswith('classChain') else
+                                            locator + ' >> index=-1')
+    assert len(wda_server.requests) == 1
+
+
+def test_page_snapshot_answers_lookups_from_one_source(library, wda_server):
+    library.enable_page_snapshot(ttl='1min')
+    wda_server.reset()
+    library.page_should_contain_text('Row 3')
+    library.page_should_contain_element('name=row3')
+    library.page_should_not_contain_text('Row 39')
+    assert wda_server.paths() == ['/source']
+
+
+XPATH = 'xpath=//XCUIElementTypeCell[@name="row3"]'
+
+
+@pytest.mark.parametrize('keyword, args', [
+    ('page_should_contain_element', (XPATH,)),
+    ('get_elements_data', (XPATH,)),
+    ('element_text_should_be', (XPATH, 'Row 3')),
+    ('tap', (XPATH,)),
+])
+def test_xpath_is_sent_to_wda_without_local_xpath(library, wda_server, keyword, args):
+    requests_sent(wda_server, getattr(library, keyword), *args)
+    assert '/source' not in wda_server.paths()
+    assert [body['value'] for (_, path, body) in wda_server.requests
+            if path.endswith('/elements') and body['using'] == 'xpath'] != []
+
+
+def test_queued_gestures_send_xpath_targets_to_wda(library, wda_server):
+    library.start_gestures()
+    library.tap(XPATH)
+    library.tap('name=Go')
+    requests_sent(wda_server, library.perform_gestures)
+    assert [body['using'] for (_, path, body) in wda_server.requests if path.endswith('/elements')] == ['xpath']
+    assert wda_server.taps == [(195, 304), (40, 65)]
+
+
+def test_waits_watching_the_page_send_xpath_to_wda(library, wda_server):
+    requests_sent(wda_server, library.wait_until_page_does_not_contain_element, 'xpath=//*[@name="row39"]')
+    assert [body['using'] for (_, path, body) in wda_server.requests if path.endswith('/elements')] == ['xpath']
+
+
+def test_local_xpath_is_verified_on_the_device(library, wda_server):
+    library.enable_local_xpath(verify=True)
+    paths = requests_sent(wda_server, library.get_elements_data, XPATH)
+    assert paths[0] == '/source'
+    assert wda_server.requests[1][2] == {'using': 'xpath', 'value': XPATH[len('xpath='):]}
+
+
+def test_page_should_contain_all_texts_checks_one_page_source(library, wda_server):
+    paths = requests_sent(wda_server, library.page_should_contain_all_texts, 'Hello', 'Row 3', 'Row 1', 'Go')
+    assert paths == ['/source']
+
+
+def test_page_should_contain_all_texts_reports_every_missing_text(library, wda_server):
+    wda_server.reset()
+    with pytest.raises(AssertionError) as error:
+        # the row is below the window
+        library.page_should_contain_all_texts('Hello', 'Nope', 'Row 3', 'Row 39')
+    assert str(error.value) == "Page should have contained texts 'Nope', 'Row 39' but did not"
+    assert wda_server.paths() == ['/source']
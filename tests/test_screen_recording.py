@@ -0,0 +1,28 @@
+"""Screen recording and the recorded frames used by the screenshot keywords."""
+import time
+
+from fakewda import screenshot_time
+
+
+def test_screenshot_after_a_swipe_is_taken_after_the_swipe(library, wda_server, tmp_path):
+    wda_server.stamp_screenshots = True
+    library.start_screen_recording(fps=10)
+    try:
+        library.swipe(100, 600, 0, -400, duration=600)
+        swiped = time.time()
+        path = library.capture_page_screenshot(str(tmp_path / 'after-swipe.png'))
+    finally:
+        library.stop_screen_recording()
+    with open(path, 'rb') as f:
+        assert screenshot_time(f.read()) >= swiped
+
+
+def test_save_screen_recording_writes_a_gif(library, tmp_path):
+    library.start_screen_recording(fps=10, buffer='1s')
+    try:
+        time.sleep(0.3)
+        path = library.save_screen_recording(str(tmp_path / 'recording.gif'))
+    finally:
+        library.stop_screen_recording()
+    with open(path, 'rb') as f:
+        assert f.read(6) == b'GIF89a'
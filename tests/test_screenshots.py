@@ -0,0 +1,42 @@
+"""Screenshots stored by Capture Screenshot and Capture Page Screenshot, see Set Screenshot Options."""
+import os
+
+from PIL import Image
+
+
+def test_png_is_written_as_sent_by_wda(library, wda_server, tmp_path):
+    path = library.capture_screenshot(str(tmp_path / 'page.png'))
+    assert path == str(tmp_path / 'page.png')
+    assert wda_server.paths() == ['/screenshot']
+    with Image.open(path) as image:
+        assert (image.format, image.size) == ('PNG', (1170, 2532))
+
+
+def test_jpeg_with_thumbnail(library, tmp_path):
+    library.set_screenshot_options(format='jpeg', quality=50, thumbnail_width=100)
+    path = library.capture_screenshot(str(tmp_path / 'page.png'))
+    assert path == str(tmp_path / 'page.jpg')
+    with Image.open(path) as image:
+        assert (image.format, image.size) == ('JPEG', (1170, 2532))
+    with Image.open(str(tmp_path / 'page.thumb.jpg')) as thumbnail:
+        assert thumbnail.size == (100, 216)
+
+
+def test_background_writer_writes_every_screenshot_on_flush(library, tmp_path):
+    library.set_screenshot_options(format='webp', background=True)
+    paths = [library.capture_page_screenshot(str(tmp_path / ('page%d.png' % i))) for i in range(5)]
+    library._screenshots.flush()
+    assert [os.path.basename(path) for path in paths] == ['page%d.webp' % i for i in range(5)]
+    for path in paths:
+        with Image.open(path) as image:
+            assert image.format == 'WEBP'
+
+
+def test_identical_screenshot_is_not_written_again(library, wda_server, tmp_path):
+    library.set_screenshot_options(dedupe=True)
+    first = library.capture_page_screenshot(str(tmp_path / 'first.png'))
+    second = library.capture_page_screenshot(str(tmp_path / 'second.png'))
+    assert second == first
+    assert os.listdir(str(tmp_path)) == ['first.png']
+    wda_server.stamp_screenshots = True
+    assert library.capture_page_screenshot(str(tmp_path / 'third.png')) == str(tmp_path / 'third.png')
@@ -0,0 +1,49 @@
+"""Scroll Until Element Visible and Scroll Until Text Visible on a table that scrolls with the drags."""
+import pytest
+
+
+@pytest.fixture
+def scrolling(library, wda_server):
+    wda_server.scroll_table()
+    return library
+
+
+def test_scrolls_until_the_element_is_visible(scrolling, wda_server):
+    row = scrolling.scroll_until_element_visible('name=row30')
+    assert row.label == 'Row 30'
+    assert len(wda_server.actions) == 2
+
+
+def test_does_not_swipe_when_the_element_is_visible(scrolling, wda_server):
+    scrolling.scroll_until_element_visible('name=row3')
+    assert wda_server.actions == []
+
+
+def test_scrolls_until_the_text_is_visible(scrolling, wda_server):
+    scrolling.scroll_until_text_visible('Row 39')
+    assert len(wda_server.actions) == 3
+
+
+def test_swipes_inside_the_container(scrolling, wda_server):
+    scrolling.scroll_until_element_visible('name=row30', container='name=table')
+    moves = [step for step in wda_server.actions[0]['actions'][0]['actions'] if step['type'] == 'pointerMove']
+    assert all(150 <= move['y'] <= 844 for move in moves)
+    assert len(wda_server.actions) == 2
+
+
+def test_fails_when_the_content_stops_moving(scrolling, wda_server):
+    with pytest.raises(AssertionError, match="Element 'name=row99' is not visible, the content stopped moving "
+                                             "after 4 swipes"):
+        scrolling.scroll_until_element_visible('name=row99')
+    assert wda_server.offset == 1066
+
+
+def test_fails_at_the_top_of_the_content(scrolling):
+    with pytest.raises(AssertionError, match='stopped moving after 1 swipes'):
+        scrolling.scroll_until_element_visible('name=row39', direction='up')
+
+
+def test_fails_after_max_swipes(scrolling, wda_server):
+    with pytest.raises(AssertionError, match="Text 'Row 39' is not visible after 1 swipes"):
+        scrolling.scroll_until_text_visible('Row 39', max_swipes=1)
+    assert len(wda_server.actions) == 1
@@ -0,0 +1,54 @@
+"""Sessions reused across library instances, see `Open Application` with reuse_session."""
+import pytest
+
+from iOSWDALibrary import _SessionRegistry, iOSWDALibrary
+
+
+@pytest.fixture
+def libraries(tmp_path):
+    registry = _SessionRegistry(str(tmp_path / 'sessions.json'))
+    libraries = [iOSWDALibrary(), iOSWDALibrary()]
+    for library in libraries:
+        library._sessions = registry
+    return libraries
+
+
+def session_requests(server):
+    return [path for (method, path, _) in server.requests if method == 'POST' and path == '/session']
+
+
+def test_second_instance_reuses_the_session(wda_server, libraries):
+    (first, second) = libraries
+    first.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    second.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    assert session_requests(wda_server) == ['/session']
+    assert second.session.session_id == first.session.session_id == wda_server.session_id
+    assert [startup['reused'] for startup in first.get_application_startup_times()
+            + second.get_application_startup_times()] == [False, True]
+    second.page_should_contain_text('Hello')
+
+
+def test_reused_session_has_the_callbacks_of_a_new_one(wda_server, libraries):
+    (first, second) = libraries
+    first.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    second.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+
+    def callbacks(library):
+        return dict((event, [callback.__name__ for callback in functions])
+                    for (event, functions) in library.session.callbacks.items() if functions)
+    assert callbacks(second) == callbacks(first) != {}
+
+
+def test_session_of_another_application_is_not_reused(wda_server, libraries):
+    (first, second) = libraries
+    first.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    second.open_application(wda_server.url, 'com.example.other', reuse_session=True)
+    assert session_requests(wda_server) == ['/session', '/session']
+
+
+def test_closed_session_is_not_reused(wda_server, libraries):
+    (first, second) = libraries
+    first.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    first.close_application()
+    second.open_application(wda_server.url, 'com.example.app', reuse_session=True)
+    assert session_requests(wda_server) == ['/session', '/session']
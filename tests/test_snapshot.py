@@ -0,0 +1,60 @@
+"""Page snapshot kept up to date by the keywords that change the screen."""
+import pytest
+
+from fakewda import make_source
+
+
+@pytest.fixture
+def snapshot_library(library, wda_server):
+    library.enable_page_snapshot(ttl='1min')
+    wda_server.on_tap = lambda x, y: wda_server.set_source(make_source(texts=('Done',)))
+    return library
+
+
+def test_click_element_refreshes_the_snapshot(snapshot_library, wda_server):
+    snapshot_library.page_should_contain_text('Hello')
+    snapshot_library.click_element('name=Go')
+    snapshot_library.page_should_contain_text('Done')
+    snapshot_library.page_should_not_contain_text('Hello')
+
+
+def test_click_element_finds_the_element_on_the_device(snapshot_library, wda_server):
+    wda_server.reset()
+    snapshot_library.click_element('name=Go')
+    assert [path.rsplit('/', 1)[-1] for path in wda_server.paths()] == ['elements', 'rect', '0']
+
+
+def test_click_element_evaluates_xpath_locally_when_enabled(snapshot_library, wda_server):
+    snapshot_library.enable_local_xpath()
+    wda_server.reset()
+    snapshot_library.click_element('xpath=//XCUIElementTypeButton[@name="Go"]')
+    assert wda_server.paths() == ['/source', '/session/%s/wda/tap/0' % wda_server.session_id]
+    snapshot_library.page_should_contain_text('Done')
+
+
+def test_gestures_refresh_the_snapshot(snapshot_library, wda_server):
+    snapshot_library.page_should_contain_text('Hello')
+    snapshot_library.tap('name=Go')
+    snapshot_library.page_should_contain_text('Done')
+
+
+@pytest.mark.parametrize('gesture', ['drag', 'drag_and_drop_by_element'])
+def test_drag_refreshes_the_snapshot(snapshot_library, wda_server, gesture):
+    snapshot_library.page_should_contain_text('Hello')
+    wda_server.on_actions = lambda body: wda_server.set_source(make_source(texts=('Moved',)))
+    getattr(snapshot_library, gesture)('name=row1', 'name=row5')
+    snapshot_library.page_should_contain_text('Moved')
+
+
+def test_tap_on_one_element_does_not_fetch_the_page_source(library, wda_server):
+    library.tap('name=Go')
+    assert [path.rsplit('/', 1)[-1] for path in wda_server.paths()] == ['elements', 'rect', 'actions']
+    assert wda_server.taps == [(40, 65)]
+
+
+def test_queued_gestures_locate_their_elements_on_one_page_source(library, wda_server):
+    library.start_gestures()
+    library.tap('name=Go')
+    library.drag('name=row1', 'name=row5')
+    library.perform_gestures()
+    assert [path.rsplit('/', 1)[-1] for path in wda_server.paths()] == ['source', 'actions']
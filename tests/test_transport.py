@@ -0,0 +1,81 @@
+"""Retries, watchdog and circuit breaker of the HTTP transport to WDA."""
+import time
+
+import pytest
+import requests
+from urllib3.util.retry import RequestHistory
+
+from iOSWDALibrary import _Retry, _WDAUnavailableError, iOSWDALibrary
+
+STALL = 0.5
+
+
+@pytest.fixture
+def transport(wda_server):
+    library = iOSWDALibrary()
+    library.configure_wda_transport(retries=0, failure_threshold=2, reset_timeout='300ms', watchdog='200ms')
+    library.open_application(wda_server.url, 'com.example.app')
+    wda_server.reset()
+    return library
+
+
+def stall(library, wda_server, requests_count):
+    """Makes WDA stall until `requests_count` requests timed out."""
+    wda_server.latency = STALL
+    for _ in range(requests_count):
+        with pytest.raises(requests.RequestException):
+            library.get_source()
+
+
+def test_backoff_is_capped_without_backoff_max():
+    retry = _Retry(total=10, backoff_factor=0.2)
+    for _ in range(8):
+        retry = retry.new(history=retry.history + (RequestHistory('GET', '/status', None, 503, None),))
+    assert isinstance(retry, _Retry)
+    assert retry.get_backoff_time() == _Retry.BACKOFF_CAP
+
+
+def test_watchdog_bounds_a_stalled_request(transport, wda_server):
+    start = time.time()
+    stall(transport, wda_server, 1)
+    assert time.time() - start < STALL
+    assert transport._circuit.trips == 0
+
+
+def test_circuit_opens_after_failures_in_a_row_and_fails_fast(transport, wda_server):
+    stall(transport, wda_server, 2)
+    assert transport._circuit.trips == 1
+    start = time.time()
+    with pytest.raises(_WDAUnavailableError, match='failing fast'):
+        transport.get_source()
+    assert time.time() - start < 0.1
+
+
+def test_successful_request_resets_the_failure_count(transport, wda_server):
+    stall(transport, wda_server, 1)
+    wda_server.latency = 0
+    transport.get_source()
+    stall(transport, wda_server, 1)
+    assert transport._circuit.trips == 0
+
+
+def test_circuit_closes_after_reset_timeout_with_a_new_session(transport, wda_server):
+    stall(transport, wda_server, 2)
+    # WDA restarted meanwhile and lost the session of the library
+    wda_server.latency = 0
+    wda_server.session_id = 'restarted'
+    time.sleep(0.35)
+    assert transport.get_window_width() == 390
+    assert transport.session.session_id == wda_server.session_id != 'restarted'
+    assert '/session/%s/window/size' % wda_server.session_id in wda_server.paths()
+    transport.page_should_contain_text('Hello')
+
+
+def test_circuit_stays_open_while_wda_does_not_answer(transport, wda_server):
+    stall(transport, wda_server, 2)
+    wda_server.stop()
+    time.sleep(0.35)
+    with pytest.raises(_WDAUnavailableError, match='did not answer'):
+        transport.get_source()
+    with pytest.raises(_WDAUnavailableError, match='failing fast'):
+        transport.get_source()
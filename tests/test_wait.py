@@ -0,0 +1,89 @@
+"""Waiting keywords, polling the fake WDA."""
+import threading
+import time
+
+import pytest
+
+from fakewda import make_source
+from iOSWDALibrary import _PageSnapshot
+
+
+def test_wait_until_page_contains_polls_until_the_text_appears(library, wda_server):
+    timer = threading.Timer(0.3, wda_server.set_source, [make_source(texts=('Hello', 'Loaded'))])
+    timer.start()
+    library.wait_until_page_contains('Loaded', timeout='3s')
+    timer.join()
+    assert 2 < len(wda_server.requests) < 20
+
+
+def test_wait_until_page_contains_fails_after_the_timeout(library, wda_server):
+    with pytest.raises(AssertionError, match="Text 'Nope' did not appear in 200 milliseconds"):
+        library.wait_until_page_contains('Nope', timeout='200ms')
+
+
+def test_stable_time_waits_for_the_element_to_stay(library, wda_server):
+    library.wait_until_page_contains_element('name=Go', timeout='3s', stable_time='300ms')
+    assert len(wda_server.requests) > 2
+
+
+def change_page(server, times, interval=0.05):
+    """Starts changing the page source `times` times, every `interval` seconds."""
+    def run():
+        for i in range(times):
+            time.sleep(interval)
+            server.set_source(make_source(texts=('Hello', 'Step %d' % i)))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_wait_until_page_is_stable_waits_for_the_changes_to_stop(library, wda_server):
+    started = time.time()
+    thread = change_page(wda_server, 8)
+    library.wait_until_page_is_stable(stable_time='300ms', timeout='5s')
+    thread.join()
+    assert time.time() - started >= 0.4 + 0.3
+    assert wda_server.paths() == ['/source'] * len(wda_server.requests)
+
+
+def test_wait_until_page_is_stable_fails_while_the_page_changes(library, wda_server):
+    thread = change_page(wda_server, 20)
+    with pytest.raises(AssertionError, match="Page did not stay unchanged for 300ms in 500 milliseconds"):
+        library.wait_until_page_is_stable(stable_time='300ms', timeout='500ms')
+    thread.join()
+
+
+def test_wait_until_page_does_not_contain_polls_until_the_text_disappears(library, wda_server):
+    timer = threading.Timer(0.3, wda_server.set_source, [make_source(texts=())])
+    timer.start()
+    library.wait_until_page_does_not_contain('Hello', timeout='3s')
+    timer.join()
+    with pytest.raises(AssertionError, match="text 'Row 3' still"):
+        library.wait_until_page_does_not_contain('Row 3', timeout='200ms')
+
+
+def test_wait_until_page_contains_any_returns_the_first_item_found(library, wda_server):
+    timer = threading.Timer(0.3, wda_server.set_source, [make_source(texts=('Hello', 'Loaded'))])
+    timer.start()
+    assert library.wait_until_page_contains_any('Loaded', 'name=row99', timeout='3s') == 'Loaded'
+    timer.join()
+    assert library.wait_until_page_contains_any('Nope', 'name=Go', 'Hello') == 'name=Go'
+    with pytest.raises(AssertionError, match="None of 'Nope', 'name=nope' appeared in 200 milliseconds"):
+        library.wait_until_page_contains_any('Nope', 'name=nope', timeout='200ms')
+
+
+def test_wait_until_page_contains_all_reports_the_missing_items(library, wda_server):
+    library.wait_until_page_contains_all('Hello', 'name=Go', 'type=Cell')
+    with pytest.raises(AssertionError, match="'Nope', 'name=nope' did not appear in 200 milliseconds"):
+        library.wait_until_page_contains_all('Hello', 'Nope', 'name=Go', 'name=nope', timeout='200ms')
+
+
+def test_page_watcher_searches_the_page_only_when_it_changed(library, wda_server, monkeypatch):
+    searches = []
+    contains_text = _PageSnapshot.contains_text
+    monkeypatch.setattr(_PageSnapshot, 'contains_text',
+                        lambda self, text: searches.append(text) or contains_text(self, text))
+    with pytest.raises(AssertionError):
+        library.wait_until_page_does_not_contain('Hello', timeout='300ms')
+    assert len(wda_server.requests) > 2
+    assert searches == ['Hello']